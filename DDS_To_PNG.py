@@ -1,34 +1,214 @@
-from PIL import Image
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from io import BytesIO
 from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+from PIL import Image
+
+from wad import Wad, WadSource
+
+# Discord shows embed thumbnails at most this big
+THUMBNAIL_SIZE = (80, 80)
+
+MANIFEST_NAME = "manifest.json"
+
+# Where the game keeps the images the bot shows, inside Root.wad
+WAD_PATTERNS = ("GUI/NpcPortraits/*.dds", "GUI/SummonedImages/*.dds")
+
+
+def png_name(name: str) -> str:
+    """The PNG file name the bot looks up for a DDS file name."""
+    return f"{Path(name).stem}.png".replace(" ", "")
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
 
-def convert_dds_to_png(dds_file, png_file):
-    """Converts a DDS file to a PNG file.
+def convert_dds_to_png(data: bytes, png_path: Path, thumbnail: bool = False):
+    """Converts DDS image data to an optimized PNG file.
 
     Args:
-        dds_file: The path to the DDS file.
-        png_file: The path to the PNG file.
+        data: The contents of the DDS file.
+        png_path: The path to the PNG file.
+        thumbnail: Whether to shrink the image to the size Discord shows.
     """
 
-    image = Image.open(dds_file)
-    output_dir = Path.cwd() / "PNG_Images"
+    image = Image.open(BytesIO(data))
+    if thumbnail:
+        image.thumbnail(THUMBNAIL_SIZE, Image.LANCZOS)
+
+    # Write next to the target first so a crash never leaves half a PNG behind
+    temp_path = png_path.with_name(png_path.name + ".tmp")
+    image.save(temp_path, "PNG", optimize=True)
+    os.replace(temp_path, png_path)
+
+
+def convert_job(name: str, data: Optional[bytes], source: Optional[Path | WadSource], png_path: Path, previous_hash: Optional[str], thumbnail: bool) -> Tuple[str, str, bool]:
+    """Runs in a worker process. Returns the name, its content hash and whether it was converted."""
+    if data is None:
+        data = source.read_bytes()
+
+    digest = content_hash(data)
+    if digest == previous_hash and png_path.exists():
+        return name, digest, False
+
+    convert_dds_to_png(data, png_path, thumbnail)
+    return name, digest, True
+
+
+class Manifest:
+    """Remembers what every PNG was converted from, so unchanged sources are skipped."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.entries: Dict[str, dict] = {}
+
+        if path.exists():
+            try:
+                self.entries = json.loads(path.read_text())
+            except ValueError:
+                print(f"Ignoring unreadable manifest {path}")
+
+    def is_current(self, name: str, stamp: Optional[Tuple[float, int]], thumbnail: bool, png_path: Path) -> bool:
+        entry = self.entries.get(name)
+        return (
+            entry is not None
+            and stamp is not None
+            and entry.get("stamp") == list(stamp)
+            and entry.get("thumbnail") == thumbnail
+            and png_path.exists()
+        )
+
+    def previous_hash(self, name: str, thumbnail: bool) -> Optional[str]:
+        entry = self.entries.get(name)
+        if entry is None or entry.get("thumbnail") != thumbnail:
+            return None
+        return entry.get("hash")
+
+    def update(self, name: str, stamp: Optional[Tuple[float, int]], digest: str, thumbnail: bool, png_path: Path):
+        self.entries[name] = {
+            "stamp": list(stamp) if stamp is not None else None,
+            "hash": digest,
+            "thumbnail": thumbnail,
+            "output": png_path.name,
+        }
+
+    def save(self):
+        temp_path = self.path.with_name(self.path.name + ".tmp")
+        temp_path.write_text(json.dumps(self.entries, indent=1, sort_keys=True))
+        os.replace(temp_path, self.path)
+
+
+def convert_all(
+    sources: Iterable[Tuple[str, Optional[Tuple[float, int]], Optional[bytes], Optional[Path]]],
+    output_dir: Path,
+    *,
+    workers: Optional[int] = None,
+    thumbnail: bool = False,
+    force: bool = False,
+) -> Dict[str, int]:
+    """Converts every source that changed since the last run.
+
+    `sources` yields `(name, stamp, data, path)` tuples. `stamp` is a cheap
+    change marker such as `(mtime, size)`, and either `data` or `path` holds
+    the DDS contents. `path` can also be a `WadSource`, which workers read
+    straight out of the archive.
+    """
     output_dir.mkdir(parents=True, exist_ok=True)
-    output_path = output_dir / Path(png_file).name  # Use only the filename for saving
-    image.save(output_path, "PNG")
+    manifest = Manifest(output_dir / MANIFEST_NAME)
+    counts = {"converted": 0, "unchanged": 0, "failed": 0, "duplicate": 0}
+    # Which source writes every PNG, the first source wins
+    outputs: Dict[Path, str] = {}
 
-if __name__ == "__main__":
-    folder_path = Path("SummonedImages")
-    file_list = list(folder_path.glob("*"))
+    def finish(job):
+        name, stamp, png_path = pending.pop(job)
+        try:
+            _, digest, converted = job.result()
+        except Exception as e:
+            print(f"Failed converting {name}: {e}")
+            counts["failed"] += 1
+            return
+
+        manifest.update(name, stamp, digest, thumbnail, png_path)
+        counts["converted" if converted else "unchanged"] += 1
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Bound the jobs in flight so sources read into memory are not all queued at once
+        limit = 4 * (workers or os.cpu_count() or 1)
+        pending = {}
+        for name, stamp, data, path in sources:
+            png_path = output_dir / png_name(name)
+            if outputs.setdefault(png_path, name) != name:
+                print(f"Skipping {name}, {outputs[png_path]} already writes {png_path.name}")
+                counts["duplicate"] += 1
+                continue
+
+            if not force and manifest.is_current(name, stamp, thumbnail, png_path):
+                counts["unchanged"] += 1
+                continue
+
+            if len(pending) >= limit:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for job in done:
+                    finish(job)
 
-    for file_path in file_list:
-        dds_file = str(file_path)
-        root_name = file_path.stem  # Use the stem of the file (filename without extension)
-        png_file = f"{root_name}.png"
-        png_file = png_file.replace(" ", "")
+            # The hash check still skips sources that were only touched
+            previous_hash = None if force else manifest.previous_hash(name, thumbnail)
+            job = pool.submit(convert_job, name, data, path, png_path, previous_hash, thumbnail)
+            pending[job] = (name, stamp, png_path)
 
-        print("DDS File:", dds_file)
-        print("PNG File:", png_file)
+        for job in list(pending):
+            finish(job)
 
-        convert_dds_to_png(dds_file, png_file)
+    manifest.save()
+    return counts
 
-    print("The DDS files have been converted to PNG files.")
-    print("The PNG files are located in the PNG_Images directory.")
+
+def folder_sources(folder: Path):
+    for path in sorted(folder.glob("*")):
+        if path.is_file():
+            stat = path.stat()
+            yield path.name, (stat.st_mtime, stat.st_size), None, path
+
+
+def wad_sources(wad_paths: Iterable[Path], patterns: Iterable[str] = WAD_PATTERNS):
+    patterns = list(patterns)
+    for wad_path in wad_paths:
+        with Wad(wad_path) as wad:
+            entries = wad.glob(*patterns)
+        print(f"Found {len(entries)} images in {wad_path}")
+
+        # The entry's CRC and size change whenever the game patches the image. Names
+        # include the archive, archives may hold images of the same name.
+        for entry in sorted(entries, key=lambda entry: entry.name):
+            yield f"{wad_path.name}/{entry.name}", (entry.crc, entry.size), None, WadSource(wad_path, entry)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Converts the game's DDS images to the PNGs the bot attaches.")
+    parser.add_argument("--source", type=Path, default=Path("SummonedImages"), help="folder holding the .dds files")
+    parser.add_argument("--wad", type=Path, action="append", help="read the images straight out of this KIWAD archive, e.g. Root.wad, instead of --source")
+    parser.add_argument("--pattern", action="append", help=f"path inside the archive to convert, defaults to {' and '.join(WAD_PATTERNS)}")
+    parser.add_argument("--output", type=Path, default=Path.cwd() / "PNG_Images", help="folder to write the PNGs to")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes, defaults to one per core")
+    parser.add_argument("--thumbnail", action="store_true", help=f"shrink images to {THUMBNAIL_SIZE[0]}x{THUMBNAIL_SIZE[1]}, the size Discord shows")
+    parser.add_argument("--force", action="store_true", help="convert every image even if it did not change")
+    args = parser.parse_args()
+
+    if args.wad:
+        sources = wad_sources(args.wad, args.pattern or WAD_PATTERNS)
+    else:
+        sources = folder_sources(args.source)
+
+    counts = convert_all(sources, args.output, workers=args.workers, thumbnail=args.thumbnail, force=args.force)
+    print(f"Converted {counts['converted']} images, {counts['unchanged']} unchanged, {counts['failed']} failed, {counts['duplicate']} duplicates skipped.")
+    print(f"The PNG files are located in the {args.output} directory.")
+
+
+if __name__ == "__main__":
+    main()
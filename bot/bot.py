@@ -1,114 +1,298 @@
+import asyncio
 import os
+import time
 from datetime import datetime
 from pathlib import Path
+from typing import Optional
 
-import aiosqlite
 import discord
+from discord import app_commands
 from discord.ext import commands
 from loguru import logger
 
+from . import database
+from .cache import ResultCache
+from .columnar import ColumnarSnapshot, open_columnar
+from .images import IMAGE_URLS
+from .indexes import DECK_INDEXES, ITEM_INDEXES, build_indexes
+from .patch import PatchReport, patch_database
+from .pool import ConnectionPool
+from .snapshot import content_hash, load_snapshot, save_snapshot
+from .search import FilterIndex, NameIndex, StringHeap
+
 EXTENSIONS = Path(__file__).parent / "extensions"
 
 FIND_ITEM_NAME_QUERY = """
-SELECT locale_en.data FROM items
+SELECT locale_en.data, items.equip_school, items.kind, items.equip_level FROM items
 INNER JOIN locale_en ON locale_en.id == items.name
 """
 
 FIND_SPELL_NAME_QUERY = """
-SELECT locale_en.data FROM spells
+SELECT locale_en.data, spells.school, spells.form, spells.rank FROM spells
 INNER JOIN locale_en ON locale_en.id == spells.name
 """
 
 FIND_MOB_NAME_QUERY = """
-SELECT locale_en.data FROM mobs
+SELECT locale_en.data, mobs.primary_school, mobs.title, mobs.rank FROM mobs
 INNER JOIN locale_en ON locale_en.id == mobs.name
 """
 
 FIND_PET_NAME_QUERY = """
-SELECT locale_en.data FROM pets
+SELECT locale_en.data, pets.school, pets.wow_factor, pets.exclusive FROM pets
 INNER JOIN locale_en ON locale_en.id == pets.name
 """
 
 FIND_FISH_NAME_QUERY = """
-SELECT locale_en.data FROM fish
+SELECT locale_en.data, fish.school, fish.rank, fish.is_sentinel FROM fish
 INNER JOIN locale_en ON locale_en.id == fish.name
 """
 
+# The name query and filter columns behind each searchable kind
+NAME_QUERIES = {
+    "item": (FIND_ITEM_NAME_QUERY, ("school", "kind", "level")),
+    "spell": (FIND_SPELL_NAME_QUERY, ("school", "kind", "rank")),
+    "mob": (FIND_MOB_NAME_QUERY, ("school", "kind", "rank")),
+    "pet": (FIND_PET_NAME_QUERY, ("school", "wow", "exclusive")),
+    "fish": (FIND_FISH_NAME_QUERY, ("school", "rank", "is_sentinel")),
+}
+
+
+def build_search_state(kind: str, rows: list) -> dict:
+    # Every distinct name is stored once, the list holds a string id per row
+    strings, name_ids = StringHeap.build([row[0] for row in rows])
+    return {
+        f"{kind}_list": name_ids,
+        # The trigram index used for fuzzy name lookups
+        f"{kind}_index": NameIndex(strings),
+        # The in-memory filter bitsets from the same rows
+        f"{kind}_filters": FilterIndex(NAME_QUERIES[kind][1], rows, strings, name_ids),
+    }
+
+
+class GatedCommandTree(app_commands.CommandTree):
+    """Turns interactions away until the bot's data layer is ready."""
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if self.client.data_ready.is_set():
+            return True
+
+        if interaction.type is discord.InteractionType.autocomplete:
+            await interaction.response.autocomplete([])
+        else:
+            await interaction.response.send_message("Still loading game data, try again in a few seconds.", ephemeral=True)
+        return False
+
+
 class TheBot(commands.Bot):
     def __init__(self, db_path: Path, deck_db_path: Path, **kwargs):
-        super().__init__(**kwargs)
+        super().__init__(tree_cls=GatedCommandTree, **kwargs)
 
-        self.ready_once = False
+        self.data_ready = asyncio.Event()
+        self.reload_lock = asyncio.Lock()
+        self.startup_task = None
         self.db_path = db_path
         self.deck_db_path = deck_db_path
+        self.snapshot_path = db_path.with_suffix(".snapshot")
+        self.columns_path = db_path.with_suffix(".columns")
         self.db = None
         self.deck_db = None
+        self.columns = None
         self.item_list = []
         self.spell_list = []
         self.mob_list = []
         self.pet_list = []
         self.fish_list = []
+        self.item_index = None
+        self.spell_index = None
+        self.mob_index = None
+        self.pet_index = None
+        self.fish_index = None
+        self.item_filters = None
+        self.spell_filters = None
+        self.mob_filters = None
+        self.pet_filters = None
+        self.fish_filters = None
+        self.mob_stats = {}
+        self.result_cache = ResultCache()
         self.uptime = datetime.now()
 
-    async def on_ready(self):
-        
-        if self.ready_once:
-            return
-        self.ready_once = True
-        
-        # If we are not connected yet, connect to db.
-        async with aiosqlite.connect(self.db_path) as db:
-            self.db = await aiosqlite.connect(":memory:")
-            await db.backup(self.db)
-        
-        async with aiosqlite.connect(self.deck_db_path) as db:
-            self.deck_db = await aiosqlite.connect(":memory:")
-            await db.backup(self.deck_db)
-
-        # Make our item list        
-        async with self.db.execute(FIND_ITEM_NAME_QUERY) as cursor:
-            tuple_item_list = await cursor.fetchall()
-
-        for i in tuple_item_list:
-            self.item_list.append(i[0])
-
-        # Make our spell list
-        async with self.db.execute(FIND_SPELL_NAME_QUERY) as cursor:
-            tuple_spell_list = await cursor.fetchall()
+    async def setup_hook(self):
+        # Images are uploaded to this channel once and linked from there
+        image_channel = os.environ.get("IMAGE_CHANNEL_ID")
+        if image_channel:
+            IMAGE_URLS.channel = self.get_partial_messageable(int(image_channel))
 
-        for i in tuple_spell_list:
-            self.spell_list.append(i[0])
+        # Load in the background so the gateway connects meanwhile
+        self.startup_task = asyncio.create_task(self.load_data())
+        self.startup_task.add_done_callback(self.on_startup_done)
 
-        # Make our mob list
-        async with self.db.execute(FIND_MOB_NAME_QUERY) as cursor:
-            tuple_mob_list = await cursor.fetchall()
+    def on_startup_done(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.opt(exception=task.exception()).error("Failed loading the data layer")
 
-        for i in tuple_mob_list:
-            self.mob_list.append(i[0])
-
-        # Make our pet list
-        async with self.db.execute(FIND_PET_NAME_QUERY) as cursor:
-            tuple_pet_list = await cursor.fetchall()
-
-        for i in tuple_pet_list:
-            self.pet_list.append(i[0])
-
-        # Make our fish list
-        async with self.db.execute(FIND_FISH_NAME_QUERY) as cursor:
-            tuple_fish_list = await cursor.fetchall()
-
-        for i in tuple_fish_list:
-            self.fish_list.append(i[0])
-
-        # Load required bot extensions.
-        #await self.load_extension("jishaku")
-        ext_count = await self.load_extensions_from_dir(EXTENSIONS)
-
-        #await self.tree.sync()
+    async def on_ready(self):
         # Log information about the user.
         logger.info(f"Logged in as {self.user}")
+
+    async def timed(self, stage: str, coro):
+        started = time.perf_counter()
+        result = await coro
+        logger.info(f"Startup stage {stage} took {(time.perf_counter() - started) * 1000:.0f}ms")
+        return result
+
+    async def open_database(self, path: Path, name: str, indexes, size: int) -> ConnectionPool:
+        # Copy the database into memory behind a pool of read-only connections
+        pool = await ConnectionPool.open(path, name, size=size)
+
+        # Make sure every lookup seeks an index in the copy
+        await build_indexes(pool.writer, indexes, name)
+        return pool
+
+    async def load_snapshot(self):
+        key = await asyncio.to_thread(content_hash, self.db_path, self.deck_db_path)
+        return key, await asyncio.to_thread(load_snapshot, self.snapshot_path, key)
+
+    async def prepare_data(self):
+        """Builds a complete data layer without touching the live one."""
+        db, deck_db, columns, (key, state) = await asyncio.gather(
+            self.timed("items.db", self.open_database(self.db_path, "items", ITEM_INDEXES, 4)),
+            self.timed("decks.db", self.open_database(self.deck_db_path, "decks", DECK_INDEXES, 2)),
+            self.timed("columns", asyncio.to_thread(open_columnar, self.db_path, self.columns_path)),
+            self.timed("snapshot", self.load_snapshot()),
+        )
+
+        # Name lists, search indexes and derived tables only change with the databases
+        snapshot_missed = state is None
+        if snapshot_missed:
+            state = await self.timed("state", self.build_state(db))
+
+        return db, deck_db, columns, key, state, snapshot_missed
+
+    def install_data(self, db: ConnectionPool, deck_db: ConnectionPool, columns: ColumnarSnapshot, key: str, state: dict):
+        # Nothing here awaits, so no command ever sees half of a data layer
+        self.db = db
+        self.deck_db = deck_db
+        self.columns = columns
+        for name, value in state.items():
+            setattr(self, name, value)
+
+        # Cached results are only valid for the databases they came from
+        self.result_cache.set_version(key)
+
+        self.data_ready.set()
+        self.dispatch("data_ready")
+
+    async def load_data(self):
+        started = time.perf_counter()
+
+        # Independent stages run concurrently
+        (db, deck_db, columns, key, state, snapshot_missed), ext_count, _ = await asyncio.gather(
+            self.prepare_data(),
+            self.timed("extensions", self.load_extensions_from_dir(EXTENSIONS)),
+            self.timed("image urls", asyncio.to_thread(IMAGE_URLS.load)),
+        )
         logger.info(f"Running with {ext_count} extensions")
 
+        self.install_data(db, deck_db, columns, key, state)
+        logger.info(f"Data layer ready in {time.perf_counter() - started:.2f}s")
+
+        if snapshot_missed:
+            await self.timed("snapshot write", asyncio.to_thread(save_snapshot, self.snapshot_path, key, state))
+
+    async def reload_data(self) -> float:
+        """Loads the database files again and swaps them in while commands keep running."""
+        async with self.reload_lock:
+            return await self.replace_data()
+
+    async def replace_data(self) -> float:
+        # Callers hold reload_lock
+        started = time.perf_counter()
+        db, deck_db, columns, key, state, snapshot_missed = await self.prepare_data()
+
+        old_db, old_deck_db, old_columns = self.db, self.deck_db, self.columns
+        self.install_data(db, deck_db, columns, key, state)
+        elapsed = time.perf_counter() - started
+        logger.info(f"Swapped in reloaded data layer after {elapsed:.2f}s")
+
+        # Queries still running on the old copies finish before they close. Column
+        # lookups never await, so nothing is reading the old columns by now.
+        await asyncio.gather(old_db.close(), old_deck_db.close())
+        old_columns.close()
+
+        if snapshot_missed:
+            await self.timed("snapshot write", asyncio.to_thread(save_snapshot, self.snapshot_path, key, state))
+
+        return elapsed
+
+    async def fetch_rows(self, db: ConnectionPool, query: str) -> list:
+        async with db.execute(query) as cursor:
+            return await cursor.fetchall()
+
+    async def build_search_state(self, db: ConnectionPool, kind: str) -> dict:
+        rows = await self.fetch_rows(db, NAME_QUERIES[kind][0])
+
+        # Index building is pure Python, so keep it off the event loop
+        return await asyncio.to_thread(build_search_state, kind, rows)
+
+    async def build_state(self, db: ConnectionPool, derived=None) -> dict:
+        """Builds the derived structures named in `derived`, or all of them."""
+        if derived is None:
+            derived = {*NAME_QUERIES, "mob_stats"}
+
+        # Make our item, spell, mob, pet and fish lists
+        state = {}
+        for kind_state in await asyncio.gather(*(self.build_search_state(db, kind) for kind in NAME_QUERIES if kind in derived)):
+            state.update(kind_state)
+
+        # Mob gear never changes, so sum every mob's stats once
+        if "mob_stats" in derived:
+            state["mob_stats"] = await database.build_mob_stat_table(db)
+        return state
+
+    def current_state(self) -> dict:
+        names = [f"{kind}_{part}" for kind in NAME_QUERIES for part in ("list", "index", "filters")]
+        return {name: getattr(self, name) for name in [*names, "mob_stats"]}
+
+    async def patch_data(self, source: Optional[Path] = None) -> PatchReport:
+        """Applies only the rows of `source` that differ from the live items database.
+
+        Falls back to reloading the database files when the patched copy would not match `source`.
+        """
+        source = source or self.db_path
+        async with self.reload_lock:
+            report = await patch_database(self.db.writer, source)
+            if report.skipped:
+                # The live copy only got part of the source, so nothing can be keyed on it
+                logger.warning(f"Schema of {', '.join(report.skipped)} changed, falling back to a full reload")
+                report.reloaded = True
+                await self.replace_data()
+                return report
+            if not report.changed:
+                return report
+
+            try:
+                state = await self.timed("partial state", self.build_state(self.db, report.derived))
+                key = await asyncio.to_thread(content_hash, source, self.deck_db_path)
+                # The live copy now matches the source, so export its columns again
+                columns = await self.timed("columns", asyncio.to_thread(open_columnar, source, self.columns_path))
+            except Exception:
+                logger.exception("Patched the live database but could not rebuild what derives from it, falling back to a full reload")
+                report.reloaded = True
+                await self.replace_data()
+                return report
+
+            old_columns, self.columns = self.columns, columns
+            for name, value in state.items():
+                setattr(self, name, value)
+            old_columns.close()
+
+            self.result_cache.set_version(key)
+            self.dispatch("data_patched", report)
+
+            # The old snapshot was keyed on the unpatched files
+            await self.timed("snapshot write", asyncio.to_thread(save_snapshot, self.snapshot_path, key, self.current_state()))
+            return report
+
     async def load_extensions_from_dir(self, path: Path) -> int:
         if not path.is_dir():
             return 0
@@ -144,8 +328,17 @@ class TheBot(commands.Bot):
             await self.invoke(ctx)
 
     async def close(self):
-        await self.db.close()
-        await self.deck_db.close()
+        if self.startup_task is not None:
+            self.startup_task.cancel()
+
+        IMAGE_URLS.save()
+
+        if self.db is not None:
+            await self.db.close()
+        if self.deck_db is not None:
+            await self.deck_db.close()
+        if self.columns is not None:
+            self.columns.close()
 
     def run(self):
         super().run(os.environ["DISCORD_TOKEN"])
@@ -0,0 +1,111 @@
+import copy
+import functools
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+import discord
+
+from .images import IMAGES
+
+_MISSING = object()
+
+
+class ResultCache:
+    """LRU cache with a TTL, invalidated whenever its version stamp changes."""
+
+    def __init__(self, max_size: int = 2048, ttl: float = 6 * 60 * 60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version: Optional[str] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries: OrderedDict[Hashable, tuple] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def set_version(self, version: str):
+        if version != self.version:
+            self.clear()
+            self.version = version
+
+    def clear(self):
+        self._entries.clear()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+                self.evictions += 1
+            self.misses += 1
+            return default
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: Hashable, value: Any):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "version": self.version,
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def _freeze(result) -> tuple:
+    if isinstance(result, tuple):
+        embed, file = result
+        return copy.deepcopy(embed.to_dict()), file.filename if file else None, True
+    return copy.deepcopy(result.to_dict()), None, False
+
+
+def _thaw(entry: tuple):
+    embed_data, file_name, with_file = entry
+    embed = discord.Embed.from_dict(copy.deepcopy(embed_data))
+    if not with_file:
+        return embed
+
+    file = None
+    if file_name is not None:
+        file = IMAGES.file(file_name)
+    return embed, file
+
+
+def cached_embed(func):
+    """Caches the result of a cog's `build_*_embed(row, ...)` in `bot.result_cache`.
+
+    Embeds are stored as dicts and attachments by file name, since both are
+    mutated or consumed once they are sent.
+    """
+
+    @functools.wraps(func)
+    async def wrapper(self, row, *args, **kwargs):
+        cache: ResultCache = self.bot.result_cache
+        key = (self.qualified_name, func.__name__, tuple(row), args, tuple(sorted(kwargs.items())))
+
+        entry = cache.get(key, _MISSING)
+        if entry is not _MISSING:
+            return _thaw(entry)
+
+        result = await func(self, row, *args, **kwargs)
+        cache.put(key, _freeze(result))
+        return result
+
+    return wrapper
@@ -0,0 +1,385 @@
+import hashlib
+import json
+import mmap
+import os
+import sqlite3
+import string
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from loguru import logger
+
+from .indexes import ITEM_INDEXES, Index
+
+# Bump whenever the file layout changes
+COLUMNAR_FORMAT = 3
+
+_MAGIC = b"WIZCOLS\0"
+# magic, format, reserved, directory offset, directory length
+_HEADER = struct.Struct("<8sIIQQ")
+
+NULL_STRING = 0xFFFFFFFF
+
+_TYPECODES = {"int": "q", "real": "d", "text": "I", "blob": "I"}
+
+_REAL = struct.Struct("d")
+_WORD = struct.Struct("q")
+
+# SQLite's NOCASE only folds ASCII letters
+_NOCASE = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def _column_type(values: Iterable[Any]) -> str:
+    kinds = {type(value) for value in values if value is not None}
+    if not kinds or kinds == {int}:
+        return "int"
+    if kinds <= {int, float}:
+        return "real"
+    if kinds == {str}:
+        return "text"
+    if kinds <= {str, bytes}:
+        return "blob"
+    raise ValueError(f"Cannot store a column mixing {', '.join(sorted(kind.__name__ for kind in kinds))}")
+
+
+def _word(value) -> int:
+    # The raw 64 bits of a value in a column mixing ints and reals
+    if isinstance(value, float):
+        return _WORD.unpack(_REAL.pack(value))[0]
+    return 0 if value is None else value
+
+
+def _sort_value(value: Any, nocase: bool = False) -> tuple:
+    # Orders values like SQLite does across storage classes: NULL, numbers, text, blobs
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value.translate(_NOCASE) if nocase else value)
+    return (3, value.lower() if nocase else value)
+
+
+def _parse_key(columns: str) -> List[Tuple[str, bool]]:
+    key = []
+    for part in columns.split(","):
+        name, *collation = part.split()
+        key.append((name, bool(collation) and collation[-1].upper() == "NOCASE"))
+    return key
+
+
+class _Writer:
+    def __init__(self, f):
+        self.f = f
+        self.strings: Dict[bytes, int] = {}
+
+    def align(self):
+        padding = -self.f.tell() % 8
+        self.f.write(b"\0" * padding)
+
+    def write_array(self, values: array) -> dict:
+        self.align()
+        offset = self.f.tell()
+        values.tofile(self.f)
+        return {"offset": offset, "count": len(values), "typecode": values.typecode}
+
+    def intern(self, value) -> int:
+        if value is None:
+            return NULL_STRING
+        if isinstance(value, str):
+            value = value.encode()
+
+        string_id = self.strings.get(value)
+        if string_id is None:
+            string_id = self.strings[value] = len(self.strings)
+        return string_id
+
+    def write_heap(self) -> dict:
+        offsets = array("Q", [0])
+        for value in self.strings:
+            offsets.append(offsets[-1] + len(value))
+
+        self.align()
+        data_offset = self.f.tell()
+        for value in self.strings:
+            self.f.write(value)
+
+        return {"offsets": self.write_array(offsets), "data": data_offset}
+
+
+def _export_table(writer: _Writer, db: sqlite3.Connection, table: str, keys: List[str]) -> dict:
+    cursor = db.execute(f'SELECT * FROM "{table}"')
+    names = [description[0] for description in cursor.description]
+    rows = cursor.fetchall()
+    columns = list(zip(*rows)) if rows else [() for _ in names]
+
+    directory = {"rows": len(rows), "columns": {}, "keys": {}}
+    for name, values in zip(names, columns):
+        kind = _column_type(values)
+        entry = {"type": kind}
+
+        if kind in ("text", "blob"):
+            data = array("I", (writer.intern(value) for value in values))
+            # Both share the heap, so remember which values of a mixed column were text
+            if kind == "blob" and any(isinstance(value, str) for value in values):
+                entry["text"] = writer.write_array(array("B", (isinstance(value, str) for value in values)))
+        else:
+            if kind == "real" and any(isinstance(value, int) for value in values):
+                # Ints share the slots of the reals as raw words, so they come back exact
+                data = array("d", array("q", (_word(value) for value in values)).tobytes())
+                entry["ints"] = writer.write_array(array("B", (isinstance(value, int) for value in values)))
+            else:
+                data = array(_TYPECODES[kind], (0 if value is None else value for value in values))
+            if None in values:
+                entry["nulls"] = writer.write_array(array("B", (value is None for value in values)))
+
+        entry["data"] = writer.write_array(data)
+        directory["columns"][name] = entry
+
+    for key in keys:
+        parts = [(names.index(name), nocase) for name, nocase in _parse_key(key) if name in names]
+        if len(parts) != len(_parse_key(key)):
+            logger.warning(f"Skipping key ({key}) on {table}, it names a missing column")
+            continue
+
+        def sort_key(row_id: int) -> tuple:
+            return tuple(_sort_value(columns[column][row_id], nocase) for column, nocase in parts)
+
+        order = sorted(range(len(rows)), key=sort_key)
+        # Rows already in key order need no permutation
+        if order == list(range(len(rows))):
+            directory["keys"][key] = {"order": None}
+        else:
+            directory["keys"][key] = {"order": writer.write_array(array("I", order))}
+
+    return directory
+
+
+def source_digest(path: Path) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "blake2b").hexdigest()
+
+
+def export_columnar(source: Path, target: Path, indexes: Sequence[Index] = ITEM_INDEXES):
+    """Writes every table of `source` to `target` as memory-mappable columns.
+
+    Every index of `indexes` also becomes a sorted key on its table, and so
+    does the first column of every table.
+    """
+    digest = source_digest(source)
+    db = sqlite3.connect(source)
+    # Processes exporting at the same time each write their own file
+    temp_path = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+    try:
+        tables = [row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+
+        with open(temp_path, "wb") as f:
+            writer = _Writer(f)
+            f.write(b"\0" * _HEADER.size)
+
+            directory = {"source": digest, "tables": {}}
+            for table in tables:
+                first_column = db.execute("SELECT name FROM pragma_table_info(?) ORDER BY cid LIMIT 1", (table,)).fetchone()[0]
+                keys = [first_column] + [index.columns for index in indexes if index.table == table and index.columns != first_column]
+                directory["tables"][table] = _export_table(writer, db, table, keys)
+            directory["strings"] = writer.write_heap()
+
+            raw_directory = json.dumps(directory).encode()
+            directory_offset = f.tell()
+            f.write(raw_directory)
+
+            f.seek(0)
+            f.write(_HEADER.pack(_MAGIC, COLUMNAR_FORMAT, 0, directory_offset, len(raw_directory)))
+    finally:
+        db.close()
+
+    temp_path.replace(target)
+    logger.info(f"Exported {len(tables)} tables from {source} to {target}")
+
+
+class Column(Sequence):
+    """One column of a table, decoded lazily from the mapped file."""
+
+    def __init__(self, snapshot: "ColumnarSnapshot", entry: dict):
+        self.type = entry["type"]
+        self._snapshot = snapshot
+        self._data = snapshot._array(entry["data"])
+        self._nulls = snapshot._array(entry["nulls"]) if "nulls" in entry else None
+        self._text = snapshot._array(entry["text"]) if "text" in entry else None
+        self._ints = snapshot._array(entry["ints"]) if "ints" in entry else None
+        self._words = snapshot._array(dict(entry["data"], typecode="q")) if "ints" in entry else None
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __getitem__(self, row_id: int) -> Any:
+        if self._nulls is not None and self._nulls[row_id]:
+            return None
+
+        if self._ints is not None and self._ints[row_id]:
+            return self._words[row_id]
+
+        value = self._data[row_id]
+        if self.type == "text" or (self._text is not None and self._text[row_id]):
+            return self._snapshot.string(value)
+        if self.type == "blob":
+            return self._snapshot.blob(value)
+        return value
+
+
+class _KeyView(Sequence):
+    # The key values of a table in sorted order, for bisecting
+    def __init__(self, columns: List[Tuple[Column, bool]], order):
+        self._columns = columns
+        self._order = order
+
+    def __len__(self) -> int:
+        return len(self._columns[0][0])
+
+    def __getitem__(self, position: int) -> tuple:
+        row_id = position if self._order is None else self._order[position]
+        return tuple(_sort_value(column[row_id], nocase) for column, nocase in self._columns)
+
+
+class Table:
+    def __init__(self, snapshot: "ColumnarSnapshot", name: str, entry: dict):
+        self.name = name
+        self.columns: Dict[str, Column] = {column: Column(snapshot, column_entry) for column, column_entry in entry["columns"].items()}
+        self._row_count = entry["rows"]
+
+        self.keys: Dict[str, _KeyView] = {}
+        for key, key_entry in entry["keys"].items():
+            order = snapshot._array(key_entry["order"]) if key_entry["order"] is not None else None
+            parts = [(self.columns[column], nocase) for column, nocase in _parse_key(key)]
+            self.keys[key] = _KeyView(parts, order)
+
+    def __len__(self) -> int:
+        return self._row_count
+
+    def row(self, row_id: int) -> tuple:
+        return tuple(column[row_id] for column in self.columns.values())
+
+    def find(self, key: str, *values) -> List[int]:
+        """Returns the ids of the rows whose `key` equals `values`, in key order.
+
+        `key` is spelled like the index it came from, e.g. `"real_name COLLATE NOCASE"`.
+        `values` may be a prefix of a composite key.
+        """
+        view = self.keys[key]
+        if not 0 < len(values) <= len(view._columns):
+            raise ValueError(f"Key ({key}) takes 1 to {len(view._columns)} values, got {len(values)}")
+
+        # Rows sorted by the whole key are also sorted by any prefix of it
+        view = _KeyView(view._columns[:len(values)], view._order)
+        target = tuple(_sort_value(value, nocase) for value, (_, nocase) in zip(values, view._columns))
+        start = bisect_left(view, target)
+        stop = bisect_right(view, target, lo=start)
+        if view._order is None:
+            return list(range(start, stop))
+        return [view._order[position] for position in range(start, stop)]
+
+    def lookup(self, key: str, *values) -> List[tuple]:
+        return [self.row(row_id) for row_id in self.find(key, *values)]
+
+    def first(self, key: str, *values) -> Optional[tuple]:
+        row_ids = self.find(key, *values)
+        return self.row(min(row_ids)) if row_ids else None
+
+
+class ColumnarSnapshot:
+    """Read-only view of a file written by `export_columnar`.
+
+    Pages are only read when touched, and processes mapping the same file
+    share one copy of it in the page cache.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as e:
+            self._file.close()
+            raise ValueError(f"{path} is empty") from e
+        self._view = memoryview(self._map)
+        self._views: List[memoryview] = []
+
+        try:
+            magic, version, _, directory_offset, directory_length = _HEADER.unpack_from(self._map)
+            if magic != _MAGIC or version != COLUMNAR_FORMAT:
+                raise ValueError(f"{path} is not a version {COLUMNAR_FORMAT} columnar snapshot")
+
+            directory = json.loads(self._map[directory_offset:directory_offset + directory_length])
+            self.source = directory["source"]
+            self._string_offsets = self._array(directory["strings"]["offsets"])
+            self._string_data = directory["strings"]["data"]
+            self.tables = {name: Table(self, name, entry) for name, entry in directory["tables"].items()}
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self) -> "ColumnarSnapshot":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getitem__(self, table: str) -> Table:
+        return self.tables[table]
+
+    def _array(self, entry: dict) -> memoryview:
+        start = entry["offset"]
+        size = entry["count"] * array(entry["typecode"]).itemsize
+        view = self._view[start:start + size].cast(entry["typecode"])
+        self._views.append(view)
+        return view
+
+    def blob(self, string_id: int) -> Optional[bytes]:
+        if string_id == NULL_STRING:
+            return None
+        start = self._string_data + self._string_offsets[string_id]
+        stop = self._string_data + self._string_offsets[string_id + 1]
+        return self._map[start:stop]
+
+    def string(self, string_id: int) -> Optional[str]:
+        value = self.blob(string_id)
+        return None if value is None else value.decode()
+
+    def locale(self, locale_id: int) -> Optional[str]:
+        row = self.tables["locale_en"].first("id", locale_id)
+        return row[1] if row is not None else None
+
+    def close(self):
+        # Every view has to go before the map can close, tables still held elsewhere stop working
+        self.tables = {}
+        for view in self._views:
+            view.release()
+        self._view.release()
+        self._map.close()
+        self._file.close()
+
+
+def open_columnar(source: Path, path: Path) -> ColumnarSnapshot:
+    """Maps the columns exported from `source`, exporting them first when missing or stale."""
+    digest = source_digest(source)
+    try:
+        snapshot = ColumnarSnapshot(path)
+    except (OSError, ValueError, struct.error) as e:
+        logger.info(f"Exporting {path} from {source}: {e}")
+    else:
+        if snapshot.source == digest:
+            return snapshot
+        snapshot.close()
+        logger.info(f"Exporting {path}, {source} changed")
+
+    export_columnar(source, path)
+    return ColumnarSnapshot(path)
+
+
+if __name__ == "__main__":
+    source = Path(sys.argv[1]) if len(sys.argv) > 1 else Path("items.db")
+    export_columnar(source, Path(sys.argv[2]) if len(sys.argv) > 2 else source.with_suffix(".columns"))
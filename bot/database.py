@@ -1,6 +1,7 @@
 from enum import IntFlag, Enum
+import json
 from struct import unpack
-from typing import Tuple, List
+from typing import Dict, Tuple, List
 from dataclasses import dataclass
 import math
 
@@ -865,55 +866,115 @@ def translate_type_emoji(icon_name: str) -> PartialEmoji:
     except KeyError:
         return icon_name
 
-async def fetch_raw_item_stats(db, item: int) -> List[StatObject]:
-    stats = []
 
-    async with db.execute(
-        "SELECT * FROM item_stats WHERE item == ?", (item,)
-    ) as cursor:
+ITEM_STATS_QUERY = """
+SELECT * FROM item_stats WHERE item IN (SELECT value FROM json_each(?)) ORDER BY rowid
+"""
+
+MOB_STATS_QUERY = """
+SELECT * FROM mob_stats ORDER BY rowid
+"""
+
+MOB_ITEMS_QUERY = """
+SELECT * FROM mob_items ORDER BY rowid
+"""
+
+
+def parse_item_stat(kind: int, a: int, b: int) -> List[StatObject]:
+    match kind:
+        # Regular stat
+        case 1:
+            order, stat = translate_stat(a)
+            return [StatObject(order, b, stat)]
+
+        # Starting pips
+        case 2:
+            stats = []
+            if a != 0:
+                stats.append(StatObject(1320, a, f" {PIP}"))
+            if b != 0:
+                stats.append(StatObject(1330, b, f" {POWER_PIP}"))
+            return stats
+
+        # Speed bonus
+        case 5:
+            return [StatObject(1340, a, f"% {SPEED}")]
+
+    return []
+
+
+def parse_mob_stat(kind: int, a: int, b: int) -> List[StatObject]:
+    match kind:
+        # Regular stat
+        case 1:
+            order, stat = translate_stat(a)
+            return [StatObject(order, b, stat)]
+
+        # Starting pips
+        case 2:
+            stats = []
+            if a != 0:
+                stats.append(StatObject(1320, a, f"{PIP}"))
+            if b != 0:
+                stats.append(StatObject(1330, b, f"{POWER_PIP}"))
+            return stats
+
+        # Speed bonus
+        case 5:
+            return [StatObject(1340, a, f"{SPEED}")]
+
+    return []
+
+
+async def fetch_raw_items_stats(db, items: List[int]) -> Dict[int, List[StatObject]]:
+    stats = {item: [] for item in items}
+
+    async with db.execute(ITEM_STATS_QUERY, (sql_array(stats),)) as cursor:
         async for row in cursor:
-            a = row[3]
-            b = row[4]
-
-            match row[2]:
-                # Regular stat
-                case 1:
-                    order, stat = translate_stat(a)
-                    stats.append(StatObject(order, b, stat))
-
-                # Starting pips
-                case 2:
-                    if a != 0:
-                        stats.append(StatObject(1320, a, f" {PIP}"))
-                    if b != 0:
-                        stats.append(StatObject(1330, b, f" {POWER_PIP}"))
-
-                # Speed bonus
-                case 5:
-                    stats.append(StatObject(1340, a, f"% {SPEED}"))
+            stats[row[1]].extend(parse_item_stat(row[2], row[3], row[4]))
 
     return stats
 
-def getStatIndexFromList(statlist: List[StatObject], statorder: int) -> int:
-    for i, stat in enumerate(statlist):
-        if stat.order == statorder:
-            return i
 
-    return -1
+def merge_stats(existing_stats: List[StatObject], added_stats: List[StatObject]):
+    # Added stats go onto the first existing stat of the same order
+    positions = {}
+    for index, stat in enumerate(existing_stats):
+        positions.setdefault(stat.order, index)
 
-async def sum_stats(db, existing_stats: List[StatObject], equipped_items: List[int]):
-    existing_stats_dict = {stat.order: stat for stat in existing_stats}
+    for stat in added_stats:
+        index = positions.get(stat.order)
+        if index is not None:
+            existing_stats[index].value += stat.value
+        else:
+            positions[stat.order] = len(existing_stats)
+            existing_stats.append(StatObject(stat.order, stat.value, stat.string))
 
-    for item_id in equipped_items:
-        for stat in await fetch_raw_item_stats(db, item_id):
-            existing_stat = existing_stats_dict.get(stat.order)
-            
-            if existing_stat is not None:
-                index = getStatIndexFromList(existing_stats, existing_stat.order)
-                existing_stats[index].value = stat.value + existing_stat.value
-            else:
-                existing_stats.append(stat)
-                existing_stats_dict[stat.order] = stat
+
+async def build_mob_stat_table(db) -> Dict[int, Tuple[Tuple[int, int, str], ...]]:
+    """Sums the stats of every mob and its equipped items into `(order, value, string)` rows."""
+    mob_stats: Dict[int, List[StatObject]] = {}
+    async with db.execute(MOB_STATS_QUERY) as cursor:
+        async for row in cursor:
+            mob_stats.setdefault(row[1], []).extend(parse_mob_stat(row[2], row[3], row[4]))
+
+    mob_items: Dict[int, List[int]] = {}
+    async with db.execute(MOB_ITEMS_QUERY) as cursor:
+        async for row in cursor:
+            mob_items.setdefault(row[1], []).append(row[2])
+
+    item_stats = await fetch_raw_items_stats(db, list({item for items in mob_items.values() for item in items}))
+
+    table = {}
+    for mob in mob_stats.keys() | mob_items.keys():
+        stats = sorted(mob_stats.get(mob, []), key=lambda stat: stat.order)
+        for item in mob_items.get(mob, []):
+            merge_stats(stats, item_stats[item])
+
+        stats.sort(key=lambda stat: stat.order)
+        table[mob] = tuple((stat.order, stat.value, stat.string) for stat in stats)
+
+    return table
 
 class Buff:
     def __init__(self, value, is_pierce):
@@ -1160,9 +1221,7 @@ class EffectTarget(Enum):
     multi_target_friendly = 15
     friendly_single_not_me = 16
 
-def _make_placeholders(count: int) -> str:
-    return ", ".join(["?"] * count)
 
-def sql_chunked(lst, size):
-    for i in range(0, len(lst), size):
-        yield lst[i:i + size]
\ No newline at end of file
+def sql_array(values) -> str:
+    # Bound as one parameter and read with json_each, so IN lists of any length share a statement
+    return json.dumps([value.decode("utf-8") if isinstance(value, bytes) else value for value in values])
@@ -10,6 +10,7 @@ from discord.ext import commands
 from loguru import logger
 
 from .. import TheBot, database, emojis
+from ..cache import cached_embed
 from ..menus import ItemView
 
 FIND_FISH_QUERY = """
@@ -21,7 +22,7 @@ WHERE locale_en.data == ? COLLATE NOCASE
 FIND_FISH_WITH_FILTER_QUERY = """
 SELECT * FROM fish
 INNER JOIN locale_en ON locale_en.id == fish.name
-WHERE locale_en.data COLLATE NOCASE IN ({placeholders})
+WHERE locale_en.data COLLATE NOCASE IN (SELECT value FROM json_each(?))
 AND (? = 'Any' OR fish.school = ?)
 AND (? = -1 OR fish.rank = ?)
 AND (? IS NULL OR fish.is_sentinel = ?)
@@ -58,27 +59,31 @@ class Fish(commands.GroupCog, name="fish"):
         
         school_val = (database._SCHOOLS_STR.index(school) + 2) if school != "Any" else None
 
-        for chunk in database.sql_chunked(fish, 900):  # Stay under SQLite's limit
-            placeholders = database._make_placeholders(len(chunk))
-            query = FIND_FISH_WITH_FILTER_QUERY.format(placeholders=placeholders)
-
-            args = (
-                *chunk,
-                school, school_val,
-                rank, rank,
-                is_sentinel, is_sentinel
-            )
+        args = (
+            database.sql_array(fish),
+            school, school_val,
+            rank, rank,
+            is_sentinel, is_sentinel
+        )
 
-            async with self.bot.db.execute(query, args) as cursor:
-                rows = await cursor.fetchall()
+        async with self.bot.db.execute(FIND_FISH_WITH_FILTER_QUERY, args) as cursor:
+            rows = await cursor.fetchall()
 
-            if return_row:
-                results.extend(rows)
-            else:
-                results.extend(row[-1] for row in rows)
+        if return_row:
+            results.extend(rows)
+        else:
+            results.extend(row[-1] for row in rows)
 
         return results
 
+    def filter_fish(self, school: Optional[str] = "Any", rank: Optional[int] = -1, is_sentinel: Optional[bool] = None):
+        return self.bot.fish_filters.select(
+            school=(database._SCHOOLS_STR.index(school) + 2) if school != "Any" else None,
+            rank=rank if rank != -1 else None,
+            is_sentinel=is_sentinel,
+        )
+
+    @cached_embed
     async def build_fish_embed(self, row):
         fish_id = row[0]
         real_name = row[2].decode("utf-8")
@@ -135,17 +140,20 @@ class Fish(commands.GroupCog, name="fish"):
         else:
             rows = await self.fetch_fish_with_filter(name, school, rank, is_sentinel, return_row=True)
             if not rows:
-                filtered_rows = await self.fetch_fish_with_filter(self.bot.fish_list, school, rank, is_sentinel, return_row=True)
-                closest_rows = [(row, fuzz.token_set_ratio(name, row[-1]) + fuzz.ratio(name, row[-1])) for row in filtered_rows]
-                closest_rows = sorted(closest_rows, key=lambda x: x[1], reverse=True)
-                closest_rows = list(zip(*closest_rows))[0]
-                
-                rows = await self.fetch_fish_with_filter(closest_rows[0][-1], school, rank, is_sentinel, return_row=True)
-                if rows:
-                    logger.info("Failed to find '{}' instead searching for {}", name, closest_rows[0][-1])
+                # Filter and rank in memory, then only fetch the closest name
+                allowed = self.filter_fish(school, rank, is_sentinel)
+                candidates = self.bot.fish_index.closest(name, allowed=allowed.__contains__)
+                if candidates:
+                    closest_names = [(string, fuzz.token_set_ratio(name, string) + fuzz.ratio(name, string)) for string in candidates]
+                    closest_names = sorted(closest_names, key=lambda x: x[1], reverse=True)
+                    closest_names = list(zip(*closest_names))[0]
+
+                    rows = await self.fetch_fish_with_filter(closest_names[0], school, rank, is_sentinel, return_row=True)
+                    if rows:
+                        logger.info("Failed to find '{}' instead searching for {}", name, closest_names[0])
 
         if rows:
-            view = ItemView([await self.build_fish_embed(row) for row in rows])
+            view = ItemView(page_factory=lambda index: self.build_fish_embed(rows[index]), total_entries=len(rows))
             await view.start(interaction)
         elif not use_object_name:
             logger.info("Failed to find '{}'", name)
@@ -168,17 +176,9 @@ class Fish(commands.GroupCog, name="fish"):
         else:
             logger.info("{} searched for fish that contain '{}' in channel #{} of {}", interaction.user.name, name, interaction.channel.name, interaction.guild.name)
 
-        fish_containing_name = []
-        for fish in self.bot.fish_list:
-            fish: str
-
-            if name == '*' or name.lower() in fish.lower():
-                fish_containing_name.append(fish)
-
-        no_duplicate_fish = [*set(fish_containing_name)]
-        filtered_fish = await self.fetch_fish_with_filter(fish=no_duplicate_fish, school=school, rank=rank, is_sentinel=is_sentinel)
-        no_no_duplicate_fish = [*set(filtered_fish)]
-        alphabetic_fish = sorted(no_no_duplicate_fish)
+        # Distinct names, sorted the way the list always was rather than ignoring case
+        allowed = self.filter_fish(school, rank, is_sentinel)
+        alphabetic_fish = sorted(self.bot.fish_index.containing("" if name == '*' else name, allowed=allowed.__contains__))
 
         if len(alphabetic_fish) > 0:
             chunks = [alphabetic_fish[i:i+15] for i in range(0, len(alphabetic_fish), 15)]
@@ -200,8 +200,14 @@ class Fish(commands.GroupCog, name="fish"):
 
             await interaction.followup.send(embed=embed)
 
-        
-        
+    @find.autocomplete("name")
+    @list_names.autocomplete("name")
+    async def name_autocomplete(self, interaction: discord.Interaction, current: str) -> List[app_commands.Choice[str]]:
+        # Respect the filters the user has already picked
+        namespace = interaction.namespace
+        allowed = self.filter_fish(namespace.school or "Any", -1 if namespace.rank is None else namespace.rank, namespace.is_sentinel)
+        names = self.bot.fish_index.complete(current, allowed=allowed.__contains__)
+        return [app_commands.Choice(name=name, value=name) for name in names]
 
 
 
@@ -2,15 +2,16 @@ from typing import List, Optional, Literal
 from fuzzywuzzy import process, fuzz
 from operator import itemgetter
 import os
-from pathlib import Path
 
 import discord
 from discord import app_commands, PartialMessageable, DMChannel
 from discord.ext import commands
 from loguru import logger
 
-from ..database import StatObject, _make_placeholders, sql_chunked
+from ..database import StatObject
 from .. import TheBot, database, emojis
+from ..cache import cached_embed
+from ..images import IMAGES
 from ..menus import ItemView
 
 
@@ -23,7 +24,7 @@ WHERE locale_en.data == ? COLLATE NOCASE
 FIND_MOB_WITH_FILTER_QUERY = """
 SELECT * FROM mobs
 INNER JOIN locale_en ON locale_en.id == mobs.name
-WHERE locale_en.data COLLATE NOCASE IN ({placeholders})
+WHERE locale_en.data COLLATE NOCASE IN (SELECT value FROM json_each(?))
 AND (? = 'Any' OR mobs.primary_school = ?)
 AND (? = 'Any' OR mobs.title = ?)
 AND (? = -1 OR mobs.rank = ?)
@@ -37,6 +38,23 @@ INNER JOIN locale_en ON locale_en.id == mobs.name
 WHERE mobs.real_name == ? COLLATE NOCASE
 """
 
+FIND_ITEMS_FROM_IDS_QUERY = """
+SELECT * FROM items
+WHERE items.id IN (SELECT value FROM json_each(?))
+"""
+
+# Deck names are stored as blobs, while JSON only carries text
+FIND_DECKS_QUERY = """
+SELECT * FROM deck
+WHERE deck.name IN (SELECT CAST(value AS BLOB) FROM json_each(?))
+"""
+
+
+def author_order(row) -> str:
+    # Pages are ordered by their embed's author line, which starts with this
+    return f"{row[17]}\n({row[2].decode('utf-8')}: {row[0]})"
+
+
 class Mobs(commands.GroupCog, name="mob"):
     def __init__(self, bot: TheBot):
         self.bot = bot
@@ -58,57 +76,32 @@ class Mobs(commands.GroupCog, name="mob"):
         
         school_val = (database._SCHOOLS_STR.index(school) + 2) if school != "Any" else None
 
-        for chunk in sql_chunked(mobs, 900):  # Stay under SQLite's limit
-            placeholders = _make_placeholders(len(chunk))
-            query = FIND_MOB_WITH_FILTER_QUERY.format(placeholders=placeholders)
-
-            args = (
-                *chunk,
-                school, school_val,
-                kind, kind,
-                rank, rank
-            )
+        args = (
+            database.sql_array(mobs),
+            school, school_val,
+            kind, kind,
+            rank, rank
+        )
 
-            async with self.bot.db.execute(query, args) as cursor:
-                rows = await cursor.fetchall()
+        async with self.bot.db.execute(FIND_MOB_WITH_FILTER_QUERY, args) as cursor:
+            rows = await cursor.fetchall()
 
-            if return_row:
-                results.extend(rows)
-            else:
-                results.extend(row[-1] for row in rows)
+        if return_row:
+            results.extend(rows)
+        else:
+            results.extend(row[-1] for row in rows)
 
         return results
 
-    async def fetch_mob_stats(self, mob: int) -> List[StatObject]:
-        stats = []
-
-        async with self.bot.db.execute(
-            "SELECT * FROM mob_stats WHERE mob == ?", (mob,)
-        ) as cursor:
-            async for row in cursor:
-                a = row[3]
-                b = row[4]
-
-                match row[2]:
-                    # Regular stat
-                    case 1:
-                        order, stat = database.translate_stat(a)
-                        stats.append(StatObject(order, b, stat))
-
-                    # Starting pips
-                    case 2:
-                        if a != 0:
-                            stats.append(StatObject(1320, a, f"{emojis.PIP}"))
-                        if b != 0:
-                            stats.append(StatObject(1330, b, f"{emojis.POWER_PIP}"))
-
-                    # Speed bonus
-                    case 5:
-                        stats.append(StatObject(1340, a, f"{emojis.SPEED}"))
-
-        stats = sorted(stats, key=lambda stat: stat.order)
+    def filter_mobs(self, school: Optional[str] = "Any", kind: Optional[str] = "Any", rank: Optional[int] = -1):
+        return self.bot.mob_filters.select(
+            school=(database._SCHOOLS_STR.index(school) + 2) if school != "Any" else None,
+            kind=kind if kind != "Any" else None,
+            rank=rank if rank != -1 else None,
+        )
 
-        return stats
+    def mob_stats(self, mob: int) -> List[StatObject]:
+        return [StatObject(*stat) for stat in self.bot.mob_stats.get(mob, ())]
     
     async def fetch_mob_items(self, mob: int) -> List[str]:
         items = []
@@ -123,10 +116,9 @@ class Mobs(commands.GroupCog, name="mob"):
     
     async def fetch_item_names(self, ids: List[str]) -> List[str]:
         items = []
-        placeholders = ','.join(['?'] * len(ids))
         
         async with self.bot.db.execute(
-            f"SELECT * FROM items WHERE id IN ({placeholders})", ids
+            FIND_ITEMS_FROM_IDS_QUERY, (database.sql_array(ids),)
         ) as cursor:
             async for row in cursor:
                 items.append(row[2])
@@ -137,16 +129,16 @@ class Mobs(commands.GroupCog, name="mob"):
     
     async def fetch_mob_deck(self, item_list: List[str], mob_real_name: str) -> List[tuple]:
         deck_spells = []
-        placeholders = ','.join(['?'] * len(item_list))
+        deck_names = database.sql_array(item_list)
         async with self.bot.db.execute(
-            f"SELECT * FROM deck WHERE name IN ({placeholders})", item_list
+            FIND_DECKS_QUERY, (deck_names,)
         ) as cursor:
             async for row in cursor:
                 deck_spells.append((row[2], row[3]))
         
         if len(deck_spells) == 0:
             async with self.bot.deck_db.execute(
-                f"SELECT * FROM deck WHERE name IN ({placeholders})", item_list
+                FIND_DECKS_QUERY, (deck_names,)
             ) as cursor:
                 async for row in cursor:
                     deck_spells.append((row[2], row[3]))
@@ -160,6 +152,7 @@ class Mobs(commands.GroupCog, name="mob"):
         return deck_spells
 
 
+    @cached_embed
     async def build_mob_embed(self, row) -> discord.Embed:
         mob_id = row[0]
         real_name: str = row[2].decode("utf-8") 
@@ -180,11 +173,7 @@ class Mobs(commands.GroupCog, name="mob"):
 
         ai = [f"Intelligence {intelligence}", f"Selfishness {selfishness}", f"Aggressiveness {aggressiveness}"]
 
-        stats = await self.fetch_mob_stats(mob_id)
-        items = await self.fetch_mob_items(mob_id)
-        await database.sum_stats(self.bot.db, stats, items)
-
-        stats = sorted(stats, key=lambda stat: stat.order)
+        stats = self.mob_stats(mob_id)
         _return_stats = []
         for stat in stats:
             if "polymorph" in real_name.lower():
@@ -227,8 +216,7 @@ class Mobs(commands.GroupCog, name="mob"):
                 png_file = f"{image_name}.png"
                 png_name = png_file.replace(" ", "")
                 png_name = os.path.basename(png_name)
-                file_path = Path("PNG_Images") / png_name
-                discord_file = discord.File(file_path, filename=png_name)
+                discord_file = IMAGES.file(png_name)
                 embed.set_thumbnail(url=f"attachment://{png_name}")
             except:
                 pass
@@ -280,8 +268,7 @@ class Mobs(commands.GroupCog, name="mob"):
                 png_file = f"{image_name}.png"
                 png_name = png_file.replace(" ", "")
                 png_name = os.path.basename(png_name)
-                file_path = Path("PNG_Images") / png_name
-                discord_file = discord.File(file_path, filename=png_name)
+                discord_file = IMAGES.file(png_name)
                 embed.set_thumbnail(url=f"attachment://{png_name}")
             except:
                 pass
@@ -301,9 +288,7 @@ class Mobs(commands.GroupCog, name="mob"):
         
         buffs_as_modifiers = database.translate_buffs(buffs)
         
-        stats = await self.fetch_mob_stats(mob_id)
-        items = await self.fetch_mob_items(mob_id)
-        await database.sum_stats(self.bot.db, stats, items)
+        stats = self.mob_stats(mob_id)
         
         mob_buffs = []
         mob_block = 0
@@ -338,8 +323,7 @@ class Mobs(commands.GroupCog, name="mob"):
                 png_file = f"{image_name}.png"
                 png_name = png_file.replace(" ", "")
                 png_name = os.path.basename(png_name)
-                file_path = Path("PNG_Images") / png_name
-                discord_file = discord.File(file_path, filename=png_name)
+                discord_file = IMAGES.file(png_name)
                 embed.set_thumbnail(url=f"attachment://{png_name}")
             except:
                 pass
@@ -372,20 +356,21 @@ class Mobs(commands.GroupCog, name="mob"):
         else:
             rows = await self.fetch_mobs_with_filter(name, school, kind, rank, return_row=True)
             if not rows:
-                filtered_rows = await self.fetch_mobs_with_filter(self.bot.mob_list, school, kind, rank, return_row=True)
-                closest_rows = [(row, fuzz.token_set_ratio(name, row[-1]) + fuzz.ratio(name, row[-1])) for row in filtered_rows]
-                closest_rows = sorted(closest_rows, key=lambda x: x[1], reverse=True)
-                closest_rows = list(zip(*closest_rows))[0]
-
-                rows = await self.fetch_mobs_with_filter(closest_rows[0][-1], school, kind, rank, return_row=True)
-                if rows:
-                    logger.info("Failed to find '{}' instead searching for {}", name, closest_rows[0][-1])
+                # Filter and rank in memory, then only fetch the closest name
+                allowed = self.filter_mobs(school, kind, rank)
+                candidates = self.bot.mob_index.closest(name, allowed=allowed.__contains__)
+                if candidates:
+                    closest_names = [(string, fuzz.token_set_ratio(name, string) + fuzz.ratio(name, string)) for string in candidates]
+                    closest_names = sorted(closest_names, key=lambda x: x[1], reverse=True)
+                    closest_names = list(zip(*closest_names))[0]
+
+                    rows = await self.fetch_mobs_with_filter(closest_names[0], school, kind, rank, return_row=True)
+                    if rows:
+                        logger.info("Failed to find '{}' instead searching for {}", name, closest_names[0])
 
         if rows:
-            embeds = [await self.build_mob_embed(row) for row in rows]
-            sorted_embeds = sorted(embeds, key=lambda embed: embed[0].author.name)
-            unzipped_embeds, unzipped_images = list(zip(*sorted_embeds))
-            view = ItemView(unzipped_embeds, files=unzipped_images)
+            rows = sorted(rows, key=author_order)
+            view = ItemView(page_factory=lambda index: self.build_mob_embed(rows[index]), total_entries=len(rows))
             await view.start(interaction)
         elif not use_object_name:
             logger.info("Failed to find '{}'", name)
@@ -417,20 +402,21 @@ class Mobs(commands.GroupCog, name="mob"):
         else:
             rows = await self.fetch_mobs_with_filter(name, school, kind, rank, return_row=True)
             if not rows:
-                filtered_rows = await self.fetch_mobs_with_filter(self.bot.mob_list, school, kind, rank, return_row=True)
-                closest_rows = [(row, fuzz.token_set_ratio(name, row[-1]) + fuzz.ratio(name, row[-1])) for row in filtered_rows]
-                closest_rows = sorted(closest_rows, key=lambda x: x[1], reverse=True)
-                closest_rows = list(zip(*closest_rows))[0]
-
-                rows = await self.fetch_mobs_with_filter(closest_rows[0][-1], school, kind, rank, return_row=True)
-                if rows:
-                    logger.info("Failed to find '{}' instead searching for {}", name, closest_rows[0][-1])
+                # Filter and rank in memory, then only fetch the closest name
+                allowed = self.filter_mobs(school, kind, rank)
+                candidates = self.bot.mob_index.closest(name, allowed=allowed.__contains__)
+                if candidates:
+                    closest_names = [(string, fuzz.token_set_ratio(name, string) + fuzz.ratio(name, string)) for string in candidates]
+                    closest_names = sorted(closest_names, key=lambda x: x[1], reverse=True)
+                    closest_names = list(zip(*closest_names))[0]
+
+                    rows = await self.fetch_mobs_with_filter(closest_names[0], school, kind, rank, return_row=True)
+                    if rows:
+                        logger.info("Failed to find '{}' instead searching for {}", name, closest_names[0])
 
         if rows:
-            embeds = [await self.build_deck_embed(row) for row in rows]
-            sorted_embeds = sorted(embeds, key=lambda embed: embed[0].author.name)
-            unzipped_embeds, unzipped_images = list(zip(*sorted_embeds))
-            view = ItemView(unzipped_embeds, files=unzipped_images)
+            rows = sorted(rows, key=author_order)
+            view = ItemView(page_factory=lambda index: self.build_deck_embed(rows[index]), total_entries=len(rows))
             await view.start(interaction)
         elif not use_object_name:
             logger.info("Failed to find '{}'", name)
@@ -453,17 +439,9 @@ class Mobs(commands.GroupCog, name="mob"):
         else:
             logger.info("{} searched for mobs that contain '{}' in channel #{} of {}", interaction.user.name, name, interaction.channel.name, interaction.guild.name)
 
-        mobs_containing_name = []
-        for mob in self.bot.mob_list:
-            mob: str
-
-            if name == '*' or name.lower() in mob.lower():
-                mobs_containing_name.append(mob)
-
-        no_duplicate_mobs = [*set(mobs_containing_name)]
-        filtered_mobs = await self.fetch_mobs_with_filter(mobs=no_duplicate_mobs, school=school, kind=kind, rank=rank)
-        no_no_duplicate_mobs = [*set(filtered_mobs)]
-        alphabetic_mobs = sorted(no_no_duplicate_mobs)
+        # Distinct names, sorted the way the list always was rather than ignoring case
+        allowed = self.filter_mobs(school, kind, rank)
+        alphabetic_mobs = sorted(self.bot.mob_index.containing("" if name == '*' else name, allowed=allowed.__contains__))
 
         if len(alphabetic_mobs) > 0:
             chunks = [alphabetic_mobs[i:i+15] for i in range(0, len(alphabetic_mobs), 15)]
@@ -513,25 +491,43 @@ class Mobs(commands.GroupCog, name="mob"):
         else:
             rows = await self.fetch_mob(name)
             if not rows:
-                closest_names = [(string, fuzz.token_set_ratio(name, string) + fuzz.ratio(name, string)) for string in self.bot.mob_list]
-                closest_names = sorted(closest_names, key=lambda x: x[1], reverse=True)
-                closest_names = list(zip(*closest_names))[0]
-
-                rows = await self.fetch_mob(closest_names[0])
-                if rows:
-                    logger.info("Failed to find '{}' instead searching for {}", name, closest_names[0])
+                candidates = self.bot.mob_index.closest(name)
+                if candidates:
+                    closest_names = [(string, fuzz.token_set_ratio(name, string) + fuzz.ratio(name, string)) for string in candidates]
+                    closest_names = sorted(closest_names, key=lambda x: x[1], reverse=True)
+                    closest_names = list(zip(*closest_names))[0]
+
+                    rows = await self.fetch_mob(closest_names[0])
+                    if rows:
+                        logger.info("Failed to find '{}' instead searching for {}", name, closest_names[0])
         
         if rows:
-            embeds = [await self.build_calc_embed(row, school, base, damage, pierce, critical, buffs, pvp) for row in rows]
-            sorted_embeds = sorted(embeds, key=lambda embed: embed[0].author.name)
-            unzipped_embeds, unzipped_images = list(zip(*sorted_embeds))
-            view = ItemView(unzipped_embeds, files=unzipped_images)
+            rows = sorted(rows, key=author_order)
+            view = ItemView(
+                page_factory=lambda index: self.build_calc_embed(rows[index], school, base, damage, pierce, critical, buffs, pvp),
+                total_entries=len(rows),
+            )
             await view.start(interaction)
         elif not use_object_name:
             logger.info("Failed to find '{}'", name)
             embed = discord.Embed(description=f"No mobs with name {name} found.").set_author(name=f"Searching: {name}", icon_url=emojis.UNIVERSAL.url)
             await interaction.followup.send(embed=embed)
 
+    @find.autocomplete("name")
+    @deck.autocomplete("name")
+    @list_names.autocomplete("name")
+    async def name_autocomplete(self, interaction: discord.Interaction, current: str) -> List[app_commands.Choice[str]]:
+        # Respect the filters the user has already picked
+        namespace = interaction.namespace
+        allowed = self.filter_mobs(namespace.school or "Any", namespace.kind or "Any", -1 if namespace.rank is None else namespace.rank)
+        names = self.bot.mob_index.complete(current, allowed=allowed.__contains__)
+        return [app_commands.Choice(name=name, value=name) for name in names]
+
+    @calc.autocomplete("name")
+    async def calc_name_autocomplete(self, interaction: discord.Interaction, current: str) -> List[app_commands.Choice[str]]:
+        names = self.bot.mob_index.complete(current)
+        return [app_commands.Choice(name=name, value=name) for name in names]
+
 
 
 async def setup(bot: TheBot):
@@ -4,6 +4,7 @@ import discord
 from discord.ext import commands
 
 from .. import TheBot
+from ..images import IMAGES
 
 
 class Owner(commands.Cog, name="owner"):
@@ -16,6 +17,14 @@ class Owner(commands.Cog, name="owner"):
             return False
         return True
 
+    async def ensure_data_ready(self, ctx: commands.Context[TheBot]) -> bool:
+        # Text commands skip the tree's interaction check, and the pools are None until loaded
+        if self.bot.data_ready.is_set():
+            return True
+
+        await ctx.send("Still loading game data, try again in a few seconds.")
+        return False
+
     @commands.command()
     @commands.guild_only()
     async def sync(
@@ -56,6 +65,79 @@ class Owner(commands.Cog, name="owner"):
                 f"Synced the command tree to {synced}/{len(guilds)} servers."
             )
 
+    @commands.command()
+    async def cache(self, ctx: commands.Context[TheBot], action: Optional[Literal["clear"]] = None):
+        if not await self.ensure_data_ready(ctx):
+            return
+
+        cache = self.bot.result_cache
+        if action == "clear":
+            cache.clear()
+            IMAGES.clear()
+
+        stats = cache.stats()
+        await ctx.send(
+            f"Result cache: {stats['size']}/{cache.max_size} entries, "
+            f"{stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.1%}), "
+            f"{stats['evictions']} evictions"
+        )
+
+        images = IMAGES.stats()
+        await ctx.send(
+            f"Image store: {images['images']} images ({images['size'] / 1024 / 1024:.1f}/{IMAGES.max_bytes / 1024 / 1024:.0f} MiB), "
+            f"{images['hits']} hits, {images['misses']} misses, {images['evictions']} evictions"
+        )
+
+    @commands.command()
+    async def pool(self, ctx: commands.Context[TheBot]):
+        if not await self.ensure_data_ready(ctx):
+            return
+
+        lines = []
+        for name, pool in (("items", self.bot.db), ("decks", self.bot.deck_db)):
+            stats = pool.stats()
+            lines.append(
+                f"{name}: {stats['idle']}/{stats['size']} idle, {stats['checkouts']} checkouts, "
+                f"{stats['waits']} waited (mean {stats['mean_wait'] * 1000:.2f}ms, max {stats['max_wait'] * 1000:.2f}ms)"
+            )
+
+        await ctx.send("\n".join(lines))
+
+    @commands.command()
+    async def reloaddb(self, ctx: commands.Context[TheBot]):
+        if not await self.ensure_data_ready(ctx):
+            return
+
+        if self.bot.reload_lock.locked():
+            await ctx.send("A database reload is already running")
+            return
+
+        await ctx.send("Reloading the databases...")
+        elapsed = await self.bot.reload_data()
+        await ctx.send(f"Reloaded the databases in {elapsed:.2f}s")
+
+    @commands.command()
+    async def patchdb(self, ctx: commands.Context[TheBot]):
+        if not await self.ensure_data_ready(ctx):
+            return
+
+        if self.bot.reload_lock.locked():
+            await ctx.send("A database reload is already running")
+            return
+
+        report = await self.bot.patch_data()
+        lines = [f"Patched {report.changed} rows in {report.elapsed * 1000:.0f}ms"]
+        for diff in report.tables:
+            lines.append(f"{diff.table}: +{diff.inserted} ~{diff.updated} -{diff.deleted}")
+        if report.derived:
+            lines.append(f"Rebuilt: {', '.join(sorted(report.derived))}")
+        if report.skipped:
+            lines.append(f"Schema changed: {', '.join(report.skipped)}")
+        if report.reloaded:
+            lines.append("Fell back to a full reload")
+
+        await ctx.send("\n".join(lines))
+
 
 async def setup(bot: TheBot):
     await bot.add_cog(Owner(bot))
@@ -10,6 +10,7 @@ from discord.ext import commands
 from loguru import logger
 
 from .. import TheBot, database, emojis
+from ..cache import cached_embed
 from ..menus import ItemView
 
 FIND_PET_QUERY = """
@@ -44,7 +45,7 @@ WHERE set_bonuses.id == ?
 
 FIND_ITEMCARD_OBJECT_NAME_QUERY = """
 SELECT * FROM spells
-WHERE spells.template_id == ? COLLATE NOCASE
+WHERE spells.template_id == ?
 """
 
 TALENT_NAME_ID_QUERY = """
@@ -61,7 +62,7 @@ WHERE locale_en.id == ?
 FIND_PETS_WITH_FILTER_QUERY = """
 SELECT * FROM pets
 INNER JOIN locale_en ON locale_en.id == pets.name
-WHERE locale_en.data COLLATE NOCASE IN ({placeholders})
+WHERE locale_en.data COLLATE NOCASE IN (SELECT value FROM json_each(?))
 AND (? = 'Any' OR pets.school = ?)
 AND (? = -1 OR pets.wow_factor = ?)
 AND (? IS NULL OR pets.exclusive = ?)
@@ -100,27 +101,30 @@ class Pets(commands.GroupCog, name="pet"):
         
         school_val = (database._SCHOOLS_STR.index(school) + 2) if school != "Any" else None
 
-        for chunk in database.sql_chunked(pets, 900):  # Stay under SQLite's limit
-            placeholders = database._make_placeholders(len(chunk))
-            query = FIND_PETS_WITH_FILTER_QUERY.format(placeholders=placeholders)
-
-            args = (
-                *chunk,
-                school, school_val,
-                wow, wow,
-                exclusive, exclusive
-            )
+        args = (
+            database.sql_array(pets),
+            school, school_val,
+            wow, wow,
+            exclusive, exclusive
+        )
 
-            async with self.bot.db.execute(query, args) as cursor:
-                rows = await cursor.fetchall()
+        async with self.bot.db.execute(FIND_PETS_WITH_FILTER_QUERY, args) as cursor:
+            rows = await cursor.fetchall()
 
-            if return_row:
-                results.extend(rows)
-            else:
-                results.extend(row[-1] for row in rows)
+        if return_row:
+            results.extend(rows)
+        else:
+            results.extend(row[-1] for row in rows)
 
         return results
 
+    def filter_pets(self, school: Optional[str] = "Any", wow: Optional[int] = -1, exclusive: Optional[bool] = None):
+        return self.bot.pet_filters.select(
+            school=(database._SCHOOLS_STR.index(school) + 2) if school != "Any" else None,
+            wow=wow if wow != -1 else None,
+            exclusive=exclusive,
+        )
+
     
     async def fetch_pet_talents(self, id: str) -> List[tuple]:
         async with self.bot.db.execute(TALENT_NAME_ID_QUERY, (id,)) as cursor:
@@ -157,6 +161,7 @@ class Pets(commands.GroupCog, name="pet"):
 
         return res
 
+    @cached_embed
     async def build_pet_embed(self, row):
         pet_id = row[0]
         real_name = row[2].decode("utf-8")
@@ -249,17 +254,20 @@ class Pets(commands.GroupCog, name="pet"):
         else:
             rows = await self.fetch_pets_with_filter(name, school, wow, exclusive, return_row=True)
             if not rows:
-                filtered_rows = await self.fetch_pets_with_filter(self.bot.pet_list, school, wow, exclusive, return_row=True)
-                closest_rows = [(row, fuzz.token_set_ratio(name, row[-1]) + fuzz.ratio(name, row[-1])) for row in filtered_rows]
-                closest_rows = sorted(closest_rows, key=lambda x: x[1], reverse=True)
-                closest_rows = list(zip(*closest_rows))[0]
-                
-                rows = await self.fetch_pets_with_filter(closest_rows[0][-1], school, wow, exclusive, return_row=True)
-                if rows:
-                    logger.info("Failed to find '{}' instead searching for {}", name, closest_rows[0][-1])
+                # Filter and rank in memory, then only fetch the closest name
+                allowed = self.filter_pets(school, wow, exclusive)
+                candidates = self.bot.pet_index.closest(name, allowed=allowed.__contains__)
+                if candidates:
+                    closest_names = [(string, fuzz.token_set_ratio(name, string) + fuzz.ratio(name, string)) for string in candidates]
+                    closest_names = sorted(closest_names, key=lambda x: x[1], reverse=True)
+                    closest_names = list(zip(*closest_names))[0]
+
+                    rows = await self.fetch_pets_with_filter(closest_names[0], school, wow, exclusive, return_row=True)
+                    if rows:
+                        logger.info("Failed to find '{}' instead searching for {}", name, closest_names[0])
 
         if rows:
-            view = ItemView([await self.build_pet_embed(row) for row in rows])
+            view = ItemView(page_factory=lambda index: self.build_pet_embed(rows[index]), total_entries=len(rows))
             await view.start(interaction)
         elif not use_object_name:
             logger.info("Failed to find '{}'", name)
@@ -282,17 +290,9 @@ class Pets(commands.GroupCog, name="pet"):
         else:
             logger.info("{} searched for pets that contain '{}' in channel #{} of {}", interaction.user.name, name, interaction.channel.name, interaction.guild.name)
 
-        pets_containing_name = []
-        for pet in self.bot.pet_list:
-            pet: str
-
-            if name == '*' or name.lower() in pet.lower():
-                pets_containing_name.append(pet)
-
-        no_duplicate_pets = [*set(pets_containing_name)]
-        filtered_pets = await self.fetch_pets_with_filter(pets=no_duplicate_pets, school=school, wow=wow, exclusive=exclusive)
-        no_no_duplicate_pets = [*set(filtered_pets)]
-        alphabetic_pets = sorted(no_no_duplicate_pets)
+        # Distinct names, sorted the way the list always was rather than ignoring case
+        allowed = self.filter_pets(school, wow, exclusive)
+        alphabetic_pets = sorted(self.bot.pet_index.containing("" if name == '*' else name, allowed=allowed.__contains__))
 
         if len(alphabetic_pets) > 0:
             chunks = [alphabetic_pets[i:i+15] for i in range(0, len(alphabetic_pets), 15)]
@@ -314,8 +314,14 @@ class Pets(commands.GroupCog, name="pet"):
 
             await interaction.followup.send(embed=embed)
 
-        
-        
+    @find.autocomplete("name")
+    @list_names.autocomplete("name")
+    async def name_autocomplete(self, interaction: discord.Interaction, current: str) -> List[app_commands.Choice[str]]:
+        # Respect the filters the user has already picked
+        namespace = interaction.namespace
+        allowed = self.filter_pets(namespace.school or "Any", -1 if namespace.wow is None else namespace.wow, namespace.exclusive)
+        names = self.bot.pet_index.complete(current, allowed=allowed.__contains__)
+        return [app_commands.Choice(name=name, value=name) for name in names]
 
 
 
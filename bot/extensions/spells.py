@@ -1,9 +1,9 @@
-from typing import List, Optional, Literal
+from typing import Dict, List, Optional, Literal, Tuple
+from collections import Counter, defaultdict
 from fuzzywuzzy import process, fuzz
 from operator import attrgetter
 import re
 import os
-from pathlib import Path
 
 import discord
 from discord import app_commands, DMChannel, PartialMessageable
@@ -11,7 +11,10 @@ from discord.ext import commands
 from loguru import logger
 
 from .. import TheBot, database, emojis
+from ..cache import cached_embed
+from ..images import IMAGES
 from ..menus import ItemView
+from ..patch import PatchReport
 
 FIND_SPELL_QUERY = """
 SELECT * FROM spells
@@ -28,23 +31,23 @@ WHERE spells.real_name == ? COLLATE NOCASE
 SPELL_DESCRIPTION_QUERY = """
 SELECT locale_en.data FROM spells
 JOIN locale_en ON spells.description = locale_en.id
-WHERE spells.description = ? COLLATE NOCASE
+WHERE spells.description = ?
 """
 
-FIND_OBJECT_NAME_FROM_ID = """
-SELECT * FROM spells
-WHERE spells.template_id == ?
+FIND_OBJECT_NAMES_FROM_IDS = """
+SELECT spells.template_id, spells.real_name FROM spells
+WHERE spells.template_id IN (SELECT value FROM json_each(?))
 """
 
-FIND_MOB_OBJECT_NAME_FROM_ID = """
-SELECT * FROM mobs
-WHERE mobs.id == ?
+FIND_MOB_OBJECT_NAMES_FROM_IDS = """
+SELECT mobs.id, mobs.real_name FROM mobs
+WHERE mobs.id IN (SELECT value FROM json_each(?))
 """
 
 FIND_SPELLS_WITH_FILTER_QUERY = """
 SELECT * FROM spells
 INNER JOIN locale_en ON locale_en.id == spells.name
-WHERE locale_en.data COLLATE NOCASE IN ({placeholders})
+WHERE locale_en.data COLLATE NOCASE IN (SELECT value FROM json_each(?))
 AND (? = 'Any' OR spells.school = ?)
 AND (? = 'Any' OR spells.form = ?)
 AND (? = -1 OR spells.rank = ?)
@@ -54,9 +57,224 @@ COLLATE NOCASE
 def remove_indices(lst, indices):
     return [value for index, value in enumerate(lst) if index not in indices]
 
+
+ALL_SPELL_DESCRIPTIONS_QUERY = """
+SELECT DISTINCT spells.description, locale_en.data FROM spells
+JOIN locale_en ON spells.description = locale_en.id
+"""
+
+DESCRIPTION_VARIABLE = re.compile(r"\$([\w:]+?)(\d*)\$")
+
+# Variables that are filled from the spell's effects on every render
+EFFECT_VARIABLES = {"eA", "eAPerPip", "eAPerPipAll", "eAMax", "eARounds", "dT_image"}
+
+
+def _school_chain(subject: str, group: str) -> str:
+    # Six "not <subject> School X" clauses, each naming a different school
+    schools = "Death|Fire|Ice|Life|Myth|Storm"
+    names = [f"{group}{i}" for i in range(6)]
+
+    pattern = rf"\bnot {subject} School (?P<{names[0]}>{schools})\b"
+    for i in range(1, 6):
+        seen = "|".join(f"(?P={name})" for name in names[:i])
+        pattern += rf"(?: and not {subject} School (?!{seen})(?P<{names[i]}>{schools}))"
+
+    return rf"(?P<{group}>(?i:{pattern}))"
+
+
+def _condition_replacements(blade: str, trap: str) -> Dict[str, str]:
+    # In the order the conditions were always rewritten in, which the passes below rely on
+    return {
+        " Caster Secondary": f" {emojis.WEAVING_CASTER}",
+        " Target Secondary": f" {emojis.WEAVING_TARGET}",
+        " School Fire": f" {emojis.FIRE}",
+        " School Storm": f" {emojis.STORM}",
+        " School Ice": f" {emojis.ICE}",
+        " School Myth": f" {emojis.MYTH}",
+        " School Life": f" {emojis.LIFE}",
+        " School Death": f" {emojis.DEATH}",
+        " School Balance": f" {emojis.BALANCE}",
+        " School": "",
+        " Shield": f" {emojis.WARD}",
+        " Weakness": f" {emojis.CURSE}",
+        " DOT": f" {emojis.DOT}",
+        " HOT": f" {emojis.HOT}",
+        " Negative Aura": f" {emojis.AURA_NEGATIVE}",
+        " Aura": f" {emojis.AURA}",
+        " Blade": f" {blade}",
+        " Trap": f" {trap}",
+        " DamageOverTime": f" {emojis.DOT}",
+        " HealOverTime": f" {emojis.HOT}",
+        " Charm": f" {emojis.CHARM}/{emojis.CURSE}",
+        " Ward": f" {emojis.WARD}/{emojis.JINX}",
+        " OT": f" {emojis.DOT}/{emojis.HOT}",
+        " on": "",
+        " has": "",
+    }
+
+
+CHARM_JINX_REPLACEMENTS = _condition_replacements(emojis.CHARM, emojis.JINX)
+BLADE_TRAP_REPLACEMENTS = _condition_replacements(emojis.BLADE, emojis.TRAP)
+
+
+def _condition_passes(replacements: Dict[str, str]) -> List[re.Pattern]:
+    # A single pass would differ from rewriting one keyword after another: deleting
+    # " School" or " on" joins its neighbours, and keywords that come later may then
+    # match across the join (e.g. "  SchoolShield"). So every deletion ends a pass.
+    groups = [[]]
+    for key, value in replacements.items():
+        groups[-1].append(key)
+        if not value:
+            groups.append([])
+
+    # Balance chains go first, then the longest literal wins at any position
+    passes = []
+    for keys in filter(None, groups):
+        alternatives = [re.escape(key) for key in sorted(keys, key=len, reverse=True)]
+        if not passes:
+            alternatives = [_school_chain("Target", "target"), _school_chain("Caster", "caster"), *alternatives]
+        passes.append(re.compile("|".join(alternatives)))
+
+    return passes
+
+
+CONDITION_PASSES = _condition_passes(CHARM_JINX_REPLACEMENTS)
+
+CHROMATIC_SCHOOL_PATTERN = re.compile(
+    "|".join(re.escape(f"{school}") for school in (emojis.DEATH, emojis.FIRE, emojis.ICE, emojis.LIFE, emojis.MYTH, emojis.STORM))
+)
+
+
+def _make_condition_rewriter(replacements):
+    def rewrite(match: re.Match) -> str:
+        if match.lastgroup == "target":
+            return f"{emojis.BALANCE}"
+        if match.lastgroup == "caster":
+            return f"{emojis.SELF}{emojis.BALANCE}"
+        return replacements[match.group()]
+
+    return rewrite
+
+
+_rewrite_condition = _make_condition_rewriter(CHARM_JINX_REPLACEMENTS)
+_rewrite_blade_trap_condition = _make_condition_rewriter(BLADE_TRAP_REPLACEMENTS)
+
+
+def _unescape_description(text: str) -> str:
+    return text.replace("\\n", "\n").replace("\\r", "\r").replace('$', '')
+
+
+class DescriptionTemplate:
+    """A spell description split once into literal text and effect slots."""
+
+    def __init__(self, description: str):
+        description = re.sub(r'#-?\d+:', '', description)
+        description = re.sub("<[^>]*>", "", description)
+        description = re.sub(r"\{[^{}]*\}", "", description)
+        description = re.sub(r"%%", "%", description)
+
+        self.strip_leading = False
+        self.tokens = []
+
+        literal = []
+        position = 0
+        for match in DESCRIPTION_VARIABLE.finditer(description):
+            literal.append(description[position:match.start()])
+            position = match.end()
+
+            variable, index = match.groups()
+            actual = variable + index
+
+            if variable in EFFECT_VARIABLES:
+                self.tokens.append("".join(literal))
+                self.tokens.append((variable, int(index) - 1 if index else 0, actual))
+                literal = []
+                continue
+
+            match variable:
+                case "eAMul":
+                    literal.append("50")
+
+                case "eABonus":
+                    self.strip_leading = True
+
+                case "eAExtra":
+                    if literal and literal[-1].endswith("\\n+"):
+                        literal[-1] = literal[-1][:-3]
+                    else:
+                        literal.append(actual)
+
+                case ":":
+                    literal.append(actual if index else "->")
+
+                case _:
+                    literal.append(f"{database.translate_type_emoji(variable)}")
+
+        literal.append(description[position:])
+        self.tokens.append("".join(literal))
+
+        # Literal escapes survive the leading strip, so those templates unescape after rendering
+        if not self.strip_leading:
+            self.tokens = [_unescape_description(token) if isinstance(token, str) else token for token in self.tokens]
+
+    def render(self, effects: List[tuple]) -> str:
+        parts = []
+        for token in self.tokens:
+            if isinstance(token, str):
+                parts.append(token)
+                continue
+
+            variable, index, actual = token
+            if index > len(effects):
+                index = len(effects) - 1
+
+            match variable:
+                case "eA" | "eAPerPip" | "eAPerPipAll":
+                    if actual != "eA1" and index < len(effects):
+                        parts.append(f"{effects[index][0]}")
+
+                case "eAMax":
+                    parts.append(f"{effects[index][2]}")
+
+                case "eARounds":
+                    if index < len(effects):
+                        parts.append(f"{effects[index][2]}")
+
+                case "dT_image":
+                    if index < len(effects):
+                        parts.append(f"{effects[index][1]}")
+
+        description = "".join(parts)
+        return _unescape_description(description.lstrip()) if self.strip_leading else description
+
+
 class Spells(commands.GroupCog, name="spell"):
     def __init__(self, bot: TheBot):
         self.bot = bot
+        self.description_templates = {}
+
+    async def cog_load(self):
+        if self.bot.data_ready.is_set():
+            await self.compile_descriptions()
+
+    @commands.Cog.listener()
+    async def on_data_ready(self):
+        await self.compile_descriptions()
+
+    @commands.Cog.listener()
+    async def on_data_patched(self, report: PatchReport):
+        if "spell_descriptions" in report.derived:
+            await self.compile_descriptions()
+
+    async def compile_descriptions(self):
+        # Compile every spell description once up front
+        templates = {}
+        async with self.bot.db.execute(ALL_SPELL_DESCRIPTIONS_QUERY) as cursor:
+            async for locale_id, description in cursor:
+                if isinstance(description, str):
+                    templates[locale_id] = DescriptionTemplate(description)
+
+        self.description_templates = templates
 
     async def fetch_spell(self, name: str) -> List[tuple]:
         async with self.bot.db.execute(FIND_SPELL_QUERY, (name,)) as cursor:
@@ -67,13 +285,28 @@ class Spells(commands.GroupCog, name="spell"):
         async with self.bot.db.execute(FIND_OBJECT_NAME_QUERY, (name_bytes,)) as cursor:
             return await cursor.fetchall()
     
-    async def fetch_object_name_from_id(self, id: int) -> List[tuple]:
-        async with self.bot.db.execute(FIND_OBJECT_NAME_FROM_ID, (id,)) as cursor:
-            return await cursor.fetchall()
-    
-    async def fetch_mob_object_name_from_id(self, id: int) -> List[tuple]:
-        async with self.bot.db.execute(FIND_MOB_OBJECT_NAME_FROM_ID, (id,)) as cursor:
-            return await cursor.fetchall()
+    async def fetch_names_from_ids(self, query: str, ids) -> Dict[int, str]:
+        names = {}
+        async with self.bot.db.execute(query, (database.sql_array(ids),)) as cursor:
+            async for row in cursor:
+                names[row[0]] = row[1].decode("utf-8")
+
+        return names
+
+    async def fetch_effect_object_names(self, spell_effects) -> Tuple[Dict[int, str], Dict[int, str]]:
+        # Resolves every spell and mob an effect tree refers to in one query each
+        template_ids = set()
+        mob_ids = set()
+        for effect in spell_effects:
+            match database.SpellEffects(effect[8]):
+                case database.SpellEffects.add_spell_to_deck | database.SpellEffects.add_spell_to_hand | database.SpellEffects.modify_card_mutation:
+                    template_ids.add(effect[5])
+                case database.SpellEffects.kill_creature | database.SpellEffects.spawn_creature | database.SpellEffects.summon_creature:
+                    mob_ids.add(effect[5])
+
+        object_names = await self.fetch_names_from_ids(FIND_OBJECT_NAMES_FROM_IDS, template_ids)
+        mob_names = await self.fetch_names_from_ids(FIND_MOB_OBJECT_NAMES_FROM_IDS, mob_ids)
+        return object_names, mob_names
         
     async def fetch_spells_with_filter(self, spells: List[str], school: Optional[str] = "Any", kind: Optional[str] = "Any", rank: Optional[int] = -1, return_row=False):
         if isinstance(spells, str):
@@ -83,30 +316,47 @@ class Spells(commands.GroupCog, name="spell"):
         
         school_val = (database._SCHOOLS_STR.index(school) + 2) if school != "Any" else None
         kind_val = database._SPELL_TYPES_STR.index(kind) if kind != "Any" else None
-        for chunk in database.sql_chunked(spells, 900):  # Stay under SQLite's limit
-            placeholders = database._make_placeholders(len(chunk))
-            query = FIND_SPELLS_WITH_FILTER_QUERY.format(placeholders=placeholders)
-
-            args = (
-                *chunk,
-                school, school_val,
-                kind, kind_val,
-                rank, rank
-            )
+        args = (
+            database.sql_array(spells),
+            school, school_val,
+            kind, kind_val,
+            rank, rank
+        )
 
-            async with self.bot.db.execute(query, args) as cursor:
-                rows = await cursor.fetchall()
+        async with self.bot.db.execute(FIND_SPELLS_WITH_FILTER_QUERY, args) as cursor:
+            rows = await cursor.fetchall()
 
-            if return_row:
-                results.extend(rows)
-            else:
-                results.extend(row[-1] for row in rows)
+        if return_row:
+            results.extend(rows)
+        else:
+            results.extend(row[-1] for row in rows)
 
         return results
     
+    def filter_spells(self, school: Optional[str] = "Any", kind: Optional[str] = "Any", rank: Optional[int] = -1):
+        return self.bot.spell_filters.select(
+            school=(database._SCHOOLS_STR.index(school) + 2) if school != "Any" else None,
+            kind=database._SPELL_TYPES_STR.index(kind) if kind != "Any" else None,
+            rank=rank if rank != -1 else None,
+        )
+    
     async def fetch_description(self, flag: int) -> List[tuple]:
         async with self.bot.db.execute(SPELL_DESCRIPTION_QUERY, (flag,)) as cursor:
             return await cursor.fetchall()
+
+    async def fetch_description_template(self, flag: int) -> Optional[DescriptionTemplate]:
+        template = self.description_templates.get(flag)
+        if template is None:
+            raw_description = await self.fetch_description(flag)
+            if not raw_description:
+                return None
+
+            while type(raw_description) != str:
+                raw_description = raw_description[0]
+
+            template = self.description_templates[flag] = DescriptionTemplate(raw_description)
+
+        return template
     
     async def fetch_spell_effects(self, spell: int) -> List[str]:
         res = []
@@ -131,34 +381,10 @@ class Spells(commands.GroupCog, name="spell"):
         return res
     
     def replace_condition_with_emojis(self, string, use_blade_trap=False):
-        target_full_pattern = r"(?i)\bnot Target School (Death|Fire|Ice|Life|Myth|Storm)\b" \
-                    r"(?: and not Target School (?!\1)(Death|Fire|Ice|Life|Myth|Storm))" \
-                    r"(?: and not Target School (?!\1|\2)(Death|Fire|Ice|Life|Myth|Storm))" \
-                    r"(?: and not Target School (?!\1|\2|\3)(Death|Fire|Ice|Life|Myth|Storm))" \
-                    r"(?: and not Target School (?!\1|\2|\3|\4)(Death|Fire|Ice|Life|Myth|Storm))" \
-                    r"(?: and not Target School (?!\1|\2|\3|\4|\5)(Death|Fire|Ice|Life|Myth|Storm))"
-        string = re.sub(target_full_pattern, f"{emojis.BALANCE}", string)
-        caster_full_pattern = r"(?i)\bnot Caster School (Death|Fire|Ice|Life|Myth|Storm)\b" \
-                    r"(?: and not Caster School (?!\1)(Death|Fire|Ice|Life|Myth|Storm))" \
-                    r"(?: and not Caster School (?!\1|\2)(Death|Fire|Ice|Life|Myth|Storm))" \
-                    r"(?: and not Caster School (?!\1|\2|\3)(Death|Fire|Ice|Life|Myth|Storm))" \
-                    r"(?: and not Caster School (?!\1|\2|\3|\4)(Death|Fire|Ice|Life|Myth|Storm))" \
-                    r"(?: and not Caster School (?!\1|\2|\3|\4|\5)(Death|Fire|Ice|Life|Myth|Storm))"
-        string = re.sub(caster_full_pattern, f"{emojis.SELF}{emojis.BALANCE}", string)
-        string = string.replace(" Caster Secondary", f" {emojis.WEAVING_CASTER}")
-        string = string.replace(" Target Secondary", f" {emojis.WEAVING_TARGET}")
-        string = string.replace(" School Fire", f" {emojis.FIRE}").replace(" School Storm", f" {emojis.STORM}").replace(" School Ice", f" {emojis.ICE}").replace(" School Myth", f" {emojis.MYTH}").replace(" School Life", f" {emojis.LIFE}").replace(" School Death", f" {emojis.DEATH}").replace(" School Balance", f" {emojis.BALANCE}")
-        string = string.replace(" School", "")
-        string = string.replace(" Shield", f" {emojis.WARD}").replace(" Weakness", f" {emojis.CURSE}").replace(" DOT", f" {emojis.DOT}").replace(" HOT", f" {emojis.HOT}").replace(" Negative Aura", f" {emojis.AURA_NEGATIVE}").replace(" Aura", f" {emojis.AURA}")
-        
-        if not use_blade_trap:
-            string = string.replace(" Blade", f" {emojis.CHARM}").replace(" Trap", f" {emojis.JINX}")
-        else:
-            string = string.replace(" Blade", f" {emojis.BLADE}").replace(" Trap", f" {emojis.TRAP}")
-            
-        string = string.replace(" DamageOverTime", f" {emojis.DOT}").replace(" HealOverTime", f" {emojis.HOT}")
-        string = string.replace(" Charm", f" {emojis.CHARM}/{emojis.CURSE}").replace(" Ward", f" {emojis.WARD}/{emojis.JINX}").replace(" OT", f" {emojis.DOT}/{emojis.HOT}")
-        return string.replace(" on", "").replace(" has", "")
+        rewrite = _rewrite_blade_trap_condition if use_blade_trap else _rewrite_condition
+        for condition_pass in CONDITION_PASSES:
+            string = condition_pass.sub(rewrite, string)
+        return string
 
     def replace_consecutive_duplicates(self, input_string):
         # Split the input into lines
@@ -194,32 +420,20 @@ class Spells(commands.GroupCog, name="spell"):
         sections = text.split("\n\n")
         
         # CHROMATIC CONDENSER!
-        conditionals = {}
-        
-        for section in sections:
-            section: str
-            
-            raw_string = section.replace(f"{emojis.DEATH}", "@").replace(f"{emojis.FIRE}", "@").replace(f"{emojis.ICE}", "@").replace(f"{emojis.LIFE}", "@").replace(f"{emojis.MYTH}", "@").replace(f"{emojis.STORM}", "@")
+        raw_strings = [CHROMATIC_SCHOOL_PATTERN.sub("@", section).lstrip("\n") for section in sections]
+        conditionals = Counter(raw_strings)
 
-            raw_string = raw_string.lstrip("\n")
-            
-            if raw_string in conditionals:
-                conditionals[raw_string] = conditionals[raw_string]+1
-            else:
-                conditionals[raw_string] = 1
-        
-        indices_to_remove = []
-        keys_seen = []
-        for i, section in enumerate(sections):
-            raw_string = section.replace(f"{emojis.DEATH}", "@").replace(f"{emojis.FIRE}", "@").replace(f"{emojis.ICE}", "@").replace(f"{emojis.LIFE}", "@").replace(f"{emojis.MYTH}", "@").replace(f"{emojis.STORM}", "@").lstrip("\n")
+        result = []
+        keys_seen = set()
+        for section, raw_string in zip(sections, raw_strings):
             if conditionals[raw_string] >= 6:
                 if raw_string in keys_seen:
-                    indices_to_remove.append(i)
-                else:
-                    keys_seen = raw_string
-                    sections[i] = raw_string
+                    continue
+
+                keys_seen.add(raw_string)
+                section = raw_string
 
-        result = [value for idx, value in enumerate(sections) if idx not in indices_to_remove]
+            result.append(section)
 
         reconstruct = []
         for section in result:
@@ -231,7 +445,7 @@ class Spells(commands.GroupCog, name="spell"):
         
         return "\n\n".join(reconstruct)
     
-    async def get_string_from_effect(self, effect, parent_is_x_pip=False, parent_is_convert=False):
+    def get_string_from_effect(self, effect, object_names, mob_names, parent_is_x_pip=False, parent_is_convert=False):
         effect_id = effect[0]
         spell_id = effect[1]
         effect_class = effect[4]
@@ -270,10 +484,10 @@ class Spells(commands.GroupCog, name="spell"):
             case database.SpellEffects.add_combat_trigger_list:
                 new_line += f"Add to Combat Trigger List"
             case database.SpellEffects.add_spell_to_deck:
-                object_name = (await self.fetch_object_name_from_id(param))[0][3].decode("utf-8").replace("_", "\_")
+                object_name = object_names.get(param, str(param)).replace("_", "\\_")
                 new_line += f"Add {object_name} To Deck"
             case database.SpellEffects.add_spell_to_hand:
-                object_name = (await self.fetch_object_name_from_id(param))[0][3].decode("utf-8").replace("_", "\_")
+                object_name = object_names.get(param, str(param)).replace("_", "\\_")
                 new_line += f"Add {object_name} To Hand"
             case database.SpellEffects.after_life:
                 new_line += f"{param} {school}{emojis.HEART} {emojis.AFTERLIFE}"
@@ -359,7 +573,7 @@ class Spells(commands.GroupCog, name="spell"):
             case database.SpellEffects.invalid_spell_effect:
                 new_line += f"Invalid Spell Effect"
             case database.SpellEffects.kill_creature:
-                mob_name = (await self.fetch_mob_object_name_from_id(param))[0][2].decode("utf-8")
+                mob_name = mob_names.get(param, str(param))
                 new_line += f"Kill {mob_name}"
             case database.SpellEffects.make_targetable:
                 new_line += f"Make Targetable"
@@ -389,7 +603,7 @@ class Spells(commands.GroupCog, name="spell"):
                         new_line += f"+{param}% {emojis.TRAP}"
             
             case database.SpellEffects.modify_card_mutation:
-                object_name = await self.fetch_object_name_from_id(param)
+                object_name = object_names.get(param, str(param)).replace("_", "\\_")
                 new_line += f"Mutate to {object_name}"
             case database.SpellEffects.modify_card_rank:
                 new_line += f"Modify Rank by {param} {emojis.PIP}"
@@ -752,7 +966,7 @@ class Spells(commands.GroupCog, name="spell"):
             case database.SpellEffects.shadow_decrement_turn:
                 new_line += "Shadow Decrement Turn"
             case database.SpellEffects.spawn_creature | database.SpellEffects.summon_creature:
-                mob_name = (await self.fetch_mob_object_name_from_id(param))[0][2].decode("utf-8").replace("_", "\_")
+                mob_name = mob_names.get(param, str(param)).replace("_", "\\_")
                 new_line += f"Summon {mob_name}"
             case database.SpellEffects.steal_charm:
                 match disposition:
@@ -908,115 +1122,86 @@ class Spells(commands.GroupCog, name="spell"):
         else:
             return ""
     
-    async def recursive_generate_effect_string(self, spell_effects, effect_string, nested_level=0, parent_is_x_pip=False, parent_is_convert=False, parent_id=-1):
+    def reachable_effects(self, children, parent_id=-1):
+        # Yields the effects render_effect_tree visits, orphaned rows are never shown
+        for effect in children.get(parent_id, ()):
+            yield effect
+            if effect[4] in range(8):
+                yield from self.reachable_effects(children, parent_id=effect[0])
+
+    async def compile_effect_tree(self, spell_effects):
+        # One pass to index children by parent, one to render every reachable line.
+        # Whether a line is an X pip or convert entry only depends on its parent.
+        children = defaultdict(list)
+        effect_classes = {}
         for effect in spell_effects:
-            if effect[2] != parent_id:
-                continue
-            
-            effect_id = effect[0]
+            children[effect[2]].append(effect)
+            effect_classes[effect[0]] = effect[4]
+
+        reachable = list(self.reachable_effects(children))
+        object_names, mob_names = await self.fetch_effect_object_names(reachable)
+
+        lines = {}
+        for effect in reachable:
             effect_class = effect[4]
             effect_type = database.SpellEffects(effect[8])
-            condition = effect[16]
 
             if (effect_class == 7) or (effect_type != database.SpellEffects.invalid_spell_effect and effect_type != database.SpellEffects.shadow_self and effect_type != database.SpellEffects.convert_hanging_effect):
-                new_line = await self.get_string_from_effect(effect, parent_is_x_pip=parent_is_x_pip, parent_is_convert=parent_is_convert)
-                effect_string.append(f"{new_line}\n")
-            
+                parent_class = effect_classes.get(effect[2])
+                lines[effect[0]] = self.get_string_from_effect(effect, object_names, mob_names, parent_is_x_pip=parent_class == 2, parent_is_convert=parent_class == 6)
+
+        return dict(children), lines
+
+    def render_effect_tree(self, children, lines, effect_string, parent_id=-1):
+        for effect in children.get(parent_id, ()):
+            effect_id = effect[0]
+            effect_class = effect[4]
+            condition = effect[16]
+
+            if effect_id in lines:
+                effect_string.append(f"{lines[effect_id]}\n")
+
             match effect_class:
-                case 0:
-                    await self.recursive_generate_effect_string(spell_effects, effect_string, nested_level+1, parent_id=effect_id)
-                
-                case 3 | 5 | 7:
-                    await self.recursive_generate_effect_string(spell_effects, effect_string, nested_level, parent_id=effect_id)
-                
+                case 0 | 3 | 5 | 7:
+                    self.render_effect_tree(children, lines, effect_string, parent_id=effect_id)
+
                 case 1:
                     effect_string.append(f"\nRandom:\n")
-                    await self.recursive_generate_effect_string(spell_effects, effect_string, nested_level+1, parent_id=effect_id)
+                    self.render_effect_tree(children, lines, effect_string, parent_id=effect_id)
                     effect_string.append("\n")
-                
+
                 case 2:
                     effect_string.append(f"\nVariable:\n")
-                    await self.recursive_generate_effect_string(spell_effects, effect_string, nested_level+1, parent_is_x_pip=True, parent_id=effect_id)
+                    self.render_effect_tree(children, lines, effect_string, parent_id=effect_id)
                     effect_string.append("\n")
-                    
+
                 case 4:
                     effect_string.append(f"\n{self.replace_condition_with_emojis(condition)}:\n")
-                    await self.recursive_generate_effect_string(spell_effects, effect_string, nested_level+1, parent_id=effect_id)
+                    self.render_effect_tree(children, lines, effect_string, parent_id=effect_id)
                     effect_string.append("\n")
-                    
+
                 case 6:
                     effect_string.append(f"\n{self.replace_condition_with_emojis(condition, use_blade_trap=True)}:\n")
-                    await self.recursive_generate_effect_string(spell_effects, effect_string, nested_level+1, parent_is_convert=True, parent_id=effect_id)
+                    self.render_effect_tree(children, lines, effect_string, parent_id=effect_id)
                     effect_string.append("\n")
-                    
 
     async def generate_spell_effects_description(self, spell_effects):
+        children, lines = await self.compile_effect_tree(spell_effects)
         ret_list = []
-        await self.recursive_generate_effect_string(spell_effects, ret_list)
+        self.render_effect_tree(children, lines, ret_list)
         return "".join(ret_list)
 
-    def parse_description(self, description, effects: List[tuple]) -> str:
-        description = re.sub(r'#-?\d+:', '', description)
-        description = re.sub("<[^>]*>", "", description)
-        description = re.sub(r"\{[^{}]*\}", "", description)
-        description = re.sub(r"%%", "%", description)
-
-        for variable in re.findall(r"\$([\w:]+?)(\d*)\$", description):
-            markdown_variable = variable[0]
-            index = variable[1]
-            actual = variable[0] + variable[1]
-
-            if index:
-                index = int(index) - 1
-            else:
-                index = 0
-
-            if index > len(effects):
-                index = len(effects) - 1
-
+    async def fetch_spell_effects_description(self, spell: int, num_targets=1) -> str:
+        key = (self.qualified_name, "spell_effects", spell, num_targets)
+        description = self.bot.result_cache.get(key)
+        if description is None:
+            spell_effects = await self.fetch_real_spell_effects(spell, num_targets=num_targets)
+            description = await self.generate_spell_effects_description(spell_effects)
+            self.bot.result_cache.put(key, description)
 
-            match markdown_variable:
-                case "eA" | "eAPerPip" | "eAPerPipAll":
-                    if actual == "eA1":
-                        description = description.replace(f'${actual}$', "")
-                    elif index >= len(effects):
-                        description = description.replace(f'${actual}$', "")
-                    else:
-                        description = description.replace(f'${actual}$', f"{effects[index][0]}")
-
-                case "eAMul":
-                    description = description.replace(f'${actual}$', f"50")
-
-                case "eAMax":
-                    description = description.replace(f'${actual}$', f"{effects[index][2]}")
-
-                case "eABonus":
-                    description = description.replace(f'${actual}$', "").lstrip()
-                
-                case "eAExtra":
-                    description = description.replace(f'\\n+${actual}$', "")
+        return description
 
-                case "eARounds":
-                    if index >= len(effects):
-                        description = description.replace(f'${actual}$', "")
-                    else:
-                        description = description.replace(f'${actual}$', f"{effects[index][2]}")
-
-                case "dT_image":
-                    if index >= len(effects):
-                        description = description.replace(f'${actual}$', f"")
-                    else:
-                        description = description.replace(f'${actual}$', f"{effects[index][1]}")
-                
-                case ":":
-                    description = description.replace(f'$:$', f"->")
-
-                case _:
-                    description = description.replace(f'${actual}$', f"{database.translate_type_emoji(markdown_variable)}")
-
-
-        return description.replace("\\n", "\n").replace("\\r", "\r").replace('$', '')
-        
+    @cached_embed
     async def build_spell_embed(self, row, show_spell_effects=False, num_targets=1):
         spell_id = row[1]
         real_name = row[3].decode("utf-8")
@@ -1053,8 +1238,7 @@ class Spells(commands.GroupCog, name="spell"):
 
         parsed_description = ""
         if show_spell_effects:
-            spell_effects = await self.fetch_real_spell_effects(spell_id, num_targets=num_targets)
-            parsed_description = (await self.generate_spell_effects_description(spell_effects))
+            parsed_description = await self.fetch_spell_effects_description(spell_id, num_targets=num_targets)
             parsed_description = self.replace_consecutive_duplicates(parsed_description)
             if len(parsed_description) > 4000:
                 parsed_description = self.condense_conditionals(parsed_description)
@@ -1069,12 +1253,9 @@ class Spells(commands.GroupCog, name="spell"):
             if not effects:
                 effects.append((0, 0, 0))
                 
-            raw_description = await self.fetch_description(description)
-            if raw_description:
-                while type(raw_description) != str:
-                    raw_description = raw_description[0]
-
-                parsed_description = self.parse_description(raw_description, effects)
+            template = await self.fetch_description_template(description)
+            if template is not None:
+                parsed_description = template.render(effects)
             else:
                 parsed_description = "Description Not Found"
 
@@ -1130,8 +1311,7 @@ class Spells(commands.GroupCog, name="spell"):
                 png_file = f"{image_name}.png"
                 png_name = png_file.replace(" ", "")
                 png_name = os.path.basename(png_name)
-                file_path = Path("PNG_Images") / png_name
-                discord_file = discord.File(file_path, filename=png_name)
+                discord_file = IMAGES.file(png_name)
                 embed.set_thumbnail(url=f"attachment://{png_name}")
             except:
                 pass
@@ -1167,21 +1347,25 @@ class Spells(commands.GroupCog, name="spell"):
         else:
             rows = await self.fetch_spells_with_filter(name, school, kind, rank, return_row=True)
             if not rows:
-                filtered_rows = await self.fetch_spells_with_filter(self.bot.spell_list, school, kind, rank, return_row=True)
-                closest_rows = [(row, fuzz.token_set_ratio(name, row[-1]) + fuzz.ratio(name, row[-1])) for row in filtered_rows]
-                closest_rows = sorted(closest_rows, key=lambda x: x[1], reverse=True)
-                closest_rows = list(zip(*closest_rows))[0]
-                
-                rows = await self.fetch_spells_with_filter(closest_rows[0][-1], school, kind, rank, return_row=True)
-
-                if rows:
-                    logger.info("Failed to find '{}' instead searching for {}", name, closest_rows[0][-1])
+                # Filter and rank in memory, then only fetch the closest name
+                allowed = self.filter_spells(school, kind, rank)
+                candidates = self.bot.spell_index.closest(name, allowed=allowed.__contains__)
+                if candidates:
+                    closest_names = [(string, fuzz.token_set_ratio(name, string) + fuzz.ratio(name, string)) for string in candidates]
+                    closest_names = sorted(closest_names, key=lambda x: x[1], reverse=True)
+                    closest_names = list(zip(*closest_names))[0]
+
+                    rows = await self.fetch_spells_with_filter(closest_names[0], school, kind, rank, return_row=True)
+                    if rows:
+                        logger.info("Failed to find '{}' instead searching for {}", name, closest_names[0])
 
         if rows:
-            embeds = [await self.build_spell_embed(row, show_spell_effects=show_spell_effects, num_targets=num_targets) for row in rows]
-            sorted_embeds = sorted(embeds, key=lambda embed: embed[0].author.name)
-            unzipped_embeds, unzipped_images = list(zip(*sorted_embeds))
-            view = ItemView(unzipped_embeds, files=unzipped_images)
+            # Pages are ordered by their embed's author line, which starts with this
+            rows = sorted(rows, key=lambda row: f"{row[-1]}\n({row[3].decode('utf-8')}: {row[1]})")
+            view = ItemView(
+                page_factory=lambda index: self.build_spell_embed(rows[index], show_spell_effects=show_spell_effects, num_targets=num_targets),
+                total_entries=len(rows),
+            )
             await view.start(interaction)
         elif not use_object_name:
             logger.info("Failed to find '{}'", name)
@@ -1204,17 +1388,9 @@ class Spells(commands.GroupCog, name="spell"):
         else:
             logger.info("{} searched for spells that contain '{}' in channel #{} of {}", interaction.user.name, name, interaction.channel.name, interaction.guild.name)
 
-        spells_containing_name = []
-        for spell in self.bot.spell_list:
-            spell: str
-
-            if name == '*' or name.lower() in spell.lower():
-                spells_containing_name.append(spell)
-
-        no_duplicate_spells = [*set(spells_containing_name)]
-        filtered_spells = await self.fetch_spells_with_filter(spells=no_duplicate_spells, school=school, kind=kind, rank=rank)
-        no_no_duplicate_spells = [*set(filtered_spells)]
-        alphabetic_spells = sorted(no_no_duplicate_spells)
+        # Distinct names, sorted the way the list always was rather than ignoring case
+        allowed = self.filter_spells(school, kind, rank)
+        alphabetic_spells = sorted(self.bot.spell_index.containing("" if name == '*' else name, allowed=allowed.__contains__))
 
         if len(alphabetic_spells) > 0:
             chunks = [alphabetic_spells[i:i+15] for i in range(0, len(alphabetic_spells), 15)]
@@ -1236,8 +1412,14 @@ class Spells(commands.GroupCog, name="spell"):
 
             await interaction.followup.send(embed=embed)
 
-        
-        
+    @find.autocomplete("name")
+    @list_names.autocomplete("name")
+    async def name_autocomplete(self, interaction: discord.Interaction, current: str) -> List[app_commands.Choice[str]]:
+        # Respect the filters the user has already picked
+        namespace = interaction.namespace
+        allowed = self.filter_spells(namespace.school or "Any", namespace.kind or "Any", -1 if namespace.rank is None else namespace.rank)
+        names = self.bot.spell_index.complete(current, allowed=allowed.__contains__)
+        return [app_commands.Choice(name=name, value=name) for name in names]
 
 
 
@@ -211,7 +211,7 @@ class StatCaps(commands.GroupCog, name="statcaps"):
         if level >= 10 and level <= 180:
             rows = await self.fetch_stat_cap(level=level, school=(_SCHOOLS_STR.index(school)+2))
         
-            view = ItemView([await self.build_stat_cap_embed(row) for row in rows])
+            view = ItemView(page_factory=lambda index: self.build_stat_cap_embed(rows[index]), total_entries=len(rows))
             await view.start(interaction)
         else:
             embed = discord.Embed(description="Level Range must be between 10 to 180").set_author(name=f"Unknown Stat Cap", icon_url=emojis.UNIVERSAL.url)
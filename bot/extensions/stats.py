@@ -1,4 +1,4 @@
-from typing import List, Optional, Literal
+from typing import Dict, List, Optional, Literal, Tuple
 from fuzzywuzzy import process, fuzz
 from operator import itemgetter
 from random import choice
@@ -10,6 +10,7 @@ from loguru import logger
 
 from ..database import StatObject
 from .. import TheBot, database, emojis
+from ..cache import cached_embed
 from ..menus import ItemView
 
 
@@ -25,31 +26,14 @@ INNER JOIN locale_en ON locale_en.id == items.name
 WHERE items.real_name == ? COLLATE NOCASE
 """
 
-FIND_ITEMCARD_OBJECT_NAME_QUERY = """
-SELECT * FROM spells
-WHERE spells.template_id == ? COLLATE NOCASE
-"""
-
 FIND_SET_QUERY = """
 SELECT * FROM set_bonuses
 """
 
-SET_BONUS_NAME_QUERY = """
-SELECT locale_en.data FROM set_bonuses
-INNER JOIN locale_en ON locale_en.id == set_bonuses.name
-WHERE set_bonuses.id == ?
-"""
-
-SPELL_NAME_ID_QUERY = """
-SELECT locale_en.data FROM spells
-INNER JOIN locale_en ON locale_en.id == spells.name
-WHERE spells.template_id == ?
-"""
-
 FIND_ITEMS_WITH_FILTER_QUERY = """
 SELECT * FROM items
 INNER JOIN locale_en ON locale_en.id == items.name
-WHERE locale_en.data COLLATE NOCASE IN ({placeholders})
+WHERE locale_en.data COLLATE NOCASE IN (SELECT value FROM json_each(?))
 AND (? = 'Any' OR items.equip_school = ?)
 AND (? = 'Any' OR items.kind = ?)
 AND (? = -1 OR items.equip_level = ?)
@@ -70,13 +54,10 @@ class Stats(commands.GroupCog, name="item"):
         async with self.bot.db.execute(FIND_ITEM_OBJECT_NAME_QUERY, (name_bytes,)) as cursor:
             return await cursor.fetchall()
         
-    async def fetch_itemcard_object_name(self, id: str) -> List[tuple]:
-        async with self.bot.db.execute(FIND_ITEMCARD_OBJECT_NAME_QUERY, (id,)) as cursor:
-            return await cursor.fetchall()
-        
-    async def fetch_set_bonus_name(self, set_id: int) -> Optional[tuple]:
-        async with self.bot.db.execute(SET_BONUS_NAME_QUERY, (set_id,)) as cursor:
-            return (await cursor.fetchone())[0]
+    # Embed lookups read the mapped columns, so they never wait for a pooled connection
+    def fetch_set_bonus_name(self, set_id: int) -> Optional[str]:
+        columns = self.bot.columns
+        return columns.locale(columns["set_bonuses"].first("id", set_id)[1])
 
 
     async def fetch_items_with_filter(self, items, school: Optional[str] = "Any", kind: Optional[str] = "Any", level: Optional[int] = -1, return_row=False):
@@ -88,86 +69,102 @@ class Stats(commands.GroupCog, name="item"):
         school_val = (database._SCHOOLS_STR.index(school) + 2) if school != "Any" else None
         kind_val = (1 << database._ITEMS_STR.index(kind)) if kind != "Any" else None
 
-        for chunk in database.sql_chunked(items, 900):  # Stay under SQLite's limit
-            placeholders = database._make_placeholders(len(chunk))
-            query = FIND_ITEMS_WITH_FILTER_QUERY.format(placeholders=placeholders)
-
-            args = (
-                *chunk,
-                school, school_val,
-                kind, kind_val,
-                level, level
-            )
+        args = (
+            database.sql_array(items),
+            school, school_val,
+            kind, kind_val,
+            level, level
+        )
 
-            async with self.bot.db.execute(query, args) as cursor:
-                rows = await cursor.fetchall()
+        async with self.bot.db.execute(FIND_ITEMS_WITH_FILTER_QUERY, args) as cursor:
+            rows = await cursor.fetchall()
 
-            if return_row:
-                results.extend(rows)
-            else:
-                results.extend(row[-1] for row in rows)
+        if return_row:
+            results.extend(rows)
+        else:
+            results.extend(row[-1] for row in rows)
 
         return results
 
 
-    async def fetch_item_stats(self, item: int) -> List[str]:
-        stats = []
+    def filter_items(self, school: Optional[str] = "Any", kind: Optional[str] = "Any", level: Optional[int] = -1):
+        return self.bot.item_filters.select(
+            school=(database._SCHOOLS_STR.index(school) + 2) if school != "Any" else None,
+            kind=(1 << database._ITEMS_STR.index(kind)) if kind != "Any" else None,
+            level=level if level != -1 else None,
+        )
 
-        async with self.bot.db.execute(
-            "SELECT * FROM item_stats WHERE item == ?", (item,)
-        ) as cursor:
-            async for row in cursor:
-                a = row[3]
-                b = row[4]
-
-                match row[2]:
-                    # Regular stat
-                    case 1:
-                        order, stat = database.translate_stat(a)
-                        stats.append(StatObject(order, b, stat))
-
-                    # Starting pips
-                    case 2:
-                        if a != 0:
-                            stats.append(StatObject(1320, a, f" {emojis.PIP}"))
-                        if b != 0:
-                            stats.append(StatObject(1330, b, f" {emojis.POWER_PIP}"))
-                    
-                    # Itemcards
-                    case 3:
-                        async with self.bot.db.execute(SPELL_NAME_ID_QUERY, (a,)) as cursor:
-                            card_name = (await cursor.fetchone())[0]
-
-                        object_name = (await self.fetch_itemcard_object_name(a))[0][3]
-
-                        copies = b
-                        stats.append(StatObject(1500, 0, f"Gives {copies} {card_name} ({object_name.decode()})"))
-                    
-                    # Maycasts
-                    case 4:
-                        async with self.bot.db.execute(SPELL_NAME_ID_QUERY, (a,)) as cursor:
-                            card_name = (await cursor.fetchone())[0]
-
-                        object_name = (await self.fetch_itemcard_object_name(a))[0][3]
-
-                        stats.append(StatObject(1510, 0, f"Maycasts {card_name} ({object_name.decode()})"))
-
-                    # Speed bonus
-                    case 5:
-                        stats.append(StatObject(1350, a, f"% {emojis.SPEED}"))
-
-                    # Passengers
-                    case 6:
-                        stats.append(StatObject(1340, a, f" Passenger Mount"))
-
-        stats = sorted(stats, key=lambda stat: stat.order)
-        _return_stats = []
-        for raw_stat in stats:
-            raw_stat: StatObject
-            _return_stats.append(raw_stat.to_string())
+    def fetch_item_cards(self, template_ids: List[int]) -> Dict[int, Tuple[str, bytes]]:
+        columns = self.bot.columns
+        spells = columns["spells"]
+
+        cards = {}
+        for template_id in template_ids:
+            row_ids = spells.find("template_id", template_id)
+            if row_ids:
+                spell = min(row_ids)
+                cards[template_id] = (columns.locale(spells.columns["name"][spell]), spells.columns["real_name"][spell])
+
+        return cards
+
+    def fetch_items_stats(self, items: List[int]) -> Dict[int, List[str]]:
+        item_stats_table = self.bot.columns["item_stats"]
+        rows = [item_stats_table.row(row_id) for item in items for row_id in item_stats_table.find("item", item)]
+
+        # Resolve every item card and maycast with a single lookup
+        cards = self.fetch_item_cards(list({row[3] for row in rows if row[2] in (3, 4)}))
+
+        stats = {item: [] for item in items}
+        for row in rows:
+            item_stats = stats[row[1]]
+            a = row[3]
+            b = row[4]
+
+            match row[2]:
+                # Regular stat
+                case 1:
+                    order, stat = database.translate_stat(a)
+                    item_stats.append(StatObject(order, b, stat))
+
+                # Starting pips
+                case 2:
+                    if a != 0:
+                        item_stats.append(StatObject(1320, a, f" {emojis.PIP}"))
+                    if b != 0:
+                        item_stats.append(StatObject(1330, b, f" {emojis.POWER_PIP}"))
+                
+                # Itemcards
+                case 3:
+                    card_name, object_name = cards[a]
+
+                    copies = b
+                    item_stats.append(StatObject(1500, 0, f"Gives {copies} {card_name} ({object_name.decode()})"))
+                
+                # Maycasts
+                case 4:
+                    card_name, object_name = cards[a]
+
+                    item_stats.append(StatObject(1510, 0, f"Maycasts {card_name} ({object_name.decode()})"))
+
+                # Speed bonus
+                case 5:
+                    item_stats.append(StatObject(1350, a, f"% {emojis.SPEED}"))
+
+                # Passengers
+                case 6:
+                    item_stats.append(StatObject(1340, a, f" Passenger Mount"))
+
+        _return_stats = {}
+        for item, item_stats in stats.items():
+            item_stats = sorted(item_stats, key=lambda stat: stat.order)
+            _return_stats[item] = [raw_stat.to_string() for raw_stat in item_stats]
 
         return _return_stats
 
+    def fetch_item_stats(self, item: int) -> List[str]:
+        return self.fetch_items_stats([item])[item]
+
+    @cached_embed
     async def build_item_embed(self, row) -> discord.Embed:
         item_id = row[0]
         object_name = row[2].decode()
@@ -205,7 +202,7 @@ class Stats(commands.GroupCog, name="item"):
                 f"Max {database.translate_school(deck_school)} copies {max_school_copies}"
             )
             stats.append(f"Sideboard {max_tcs}")
-        stats.extend(await self.fetch_item_stats(item_id))
+        stats.extend(self.fetch_item_stats(item_id))
 
         embed = (
             discord.Embed(
@@ -222,7 +219,7 @@ class Stats(commands.GroupCog, name="item"):
             )
 
         if set_bonus != 0:
-            set_name = await self.fetch_set_bonus_name(set_bonus)
+            set_name = self.fetch_set_bonus_name(set_bonus)
             embed = embed.add_field(name="Set Bonus", value=set_name)
 
         emoji_flags = database.translate_flags(extra_flags)
@@ -256,17 +253,20 @@ class Stats(commands.GroupCog, name="item"):
         else:
             rows = await self.fetch_items_with_filter(items=name, school=school, kind=kind, level=level, return_row=True)
             if not rows:
-                filtered_rows = await self.fetch_items_with_filter(items=self.bot.item_list, school=school, kind=kind, level=level, return_row=True)
-                closest_rows = [(row, fuzz.token_set_ratio(name, row[-1]) + fuzz.ratio(name, row[-1])) for row in filtered_rows]
-                closest_rows = sorted(closest_rows, key=lambda x: x[1], reverse=True)
-                closest_rows = list(zip(*closest_rows))[0]
-                
-                rows = await self.fetch_items_with_filter(items=closest_rows[0][-1], school=school, kind=kind, level=level, return_row=True)
-                if rows:
-                    logger.info("Failed to find '{}' instead searching for {}", name, closest_rows[0][-1])
+                # Filter and rank in memory, then only fetch the closest name
+                allowed = self.filter_items(school, kind, level)
+                candidates = self.bot.item_index.closest(name, allowed=allowed.__contains__)
+                if candidates:
+                    closest_names = [(string, fuzz.token_set_ratio(name, string) + fuzz.ratio(name, string)) for string in candidates]
+                    closest_names = sorted(closest_names, key=lambda x: x[1], reverse=True)
+                    closest_names = list(zip(*closest_names))[0]
+
+                    rows = await self.fetch_items_with_filter(items=closest_names[0], school=school, kind=kind, level=level, return_row=True)
+                    if rows:
+                        logger.info("Failed to find '{}' instead searching for {}", name, closest_names[0])
         
         if rows:
-            view = ItemView([await self.build_item_embed(row) for row in rows])
+            view = ItemView(page_factory=lambda index: self.build_item_embed(rows[index]), total_entries=len(rows))
             await view.start(interaction)
         elif not use_object_name:
             embed = discord.Embed(description=f"No items with name {name} found.").set_author(name=f"Searching: {name}", icon_url=emojis.UNIVERSAL.url)
@@ -288,19 +288,11 @@ class Stats(commands.GroupCog, name="item"):
         else:
             logger.info("{} searched for items that contain '{}' in channel #{} of {}", interaction.user.name, name, interaction.channel.name, interaction.guild.name)
 
-        items_containing_name = []
-        for item in self.bot.item_list:
-            item: str
-
-            if name == '*' or name.lower() in item.lower():
-                items_containing_name.append(item)
-
-        if len(items_containing_name) > 0:
-            no_duplicate_items = [*set(items_containing_name)]
-            filtered_items = await self.fetch_items_with_filter(items=no_duplicate_items, school=school, kind=kind, level=level)
-            no_no_duplicate_items = [*set(filtered_items)]
-            alphabetic_items = sorted(no_no_duplicate_items)
+        # Distinct names, sorted the way the list always was rather than ignoring case
+        allowed = self.filter_items(school, kind, level)
+        alphabetic_items = sorted(self.bot.item_index.containing("" if name == '*' else name, allowed=allowed.__contains__))
 
+        if len(alphabetic_items) > 0:
             chunks = [alphabetic_items[i:i+15] for i in range(0, len(alphabetic_items), 15)]
             item_embeds = []
             for item_chunk in chunks:
@@ -322,8 +314,14 @@ class Stats(commands.GroupCog, name="item"):
 
             await interaction.followup.send(embed=embed)
 
-        
-        
+    @find.autocomplete("name")
+    @list_names.autocomplete("name")
+    async def name_autocomplete(self, interaction: discord.Interaction, current: str) -> List[app_commands.Choice[str]]:
+        # Respect the filters the user has already picked
+        namespace = interaction.namespace
+        allowed = self.filter_items(namespace.school or "Any", namespace.kind or "Any", -1 if namespace.level is None else namespace.level)
+        names = self.bot.item_index.complete(current, allowed=allowed.__contains__)
+        return [app_commands.Choice(name=name, value=name) for name in names]
 
 
 
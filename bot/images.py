@@ -0,0 +1,206 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import discord
+from loguru import logger
+
+
+class ImageStore:
+    """PNG bytes read once from disk and kept in an LRU bounded by their total size.
+
+    `discord.File`s are consumed once sent, so every call to `file` hands out a
+    new one over the cached bytes.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int = 64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._images: OrderedDict[str, bytes] = OrderedDict()
+
+    def read(self, name: str) -> bytes:
+        data = self._images.get(name)
+        if data is not None:
+            self._images.move_to_end(name)
+            self.hits += 1
+            return data
+
+        # Raises like opening the file directly would when it is missing
+        data = (self.directory / name).read_bytes()
+        self.misses += 1
+
+        self._images[name] = data
+        self.size += len(data)
+        while self.size > self.max_bytes and len(self._images) > 1:
+            _, evicted = self._images.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+        return data
+
+    def file(self, name: str, filename: Optional[str] = None) -> discord.File:
+        return discord.File(BytesIO(self.read(name)), filename=filename or name)
+
+    def clear(self):
+        self._images.clear()
+        self.size = 0
+
+    def stats(self) -> dict:
+        return {
+            "images": len(self._images),
+            "size": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+def url_expiry(url: str) -> Optional[float]:
+    """Returns when a signed Discord CDN URL stops working, None if it is not signed."""
+    expires = parse_qs(urlsplit(url).query).get("ex")
+    if not expires:
+        return None
+
+    try:
+        return float(int(expires[0], 16))
+    except ValueError:
+        return None
+
+
+class ImageURLRegistry:
+    """CDN URLs of images uploaded once to a storage channel, so embeds can link them instead of attaching them.
+
+    Nothing edits the storage channel's messages, so their URLs keep working
+    wherever they are linked. URLs are stored by file name and persisted to
+    `path` with the channel they were uploaded to. Signed URLs are dropped
+    `refresh_margin` seconds before they expire, so the next lookup uploads the
+    image again. Without a channel every image is attached instead.
+    """
+
+    def __init__(self, path: Path, refresh_margin: float = 60 * 60, save_delay: float = 30.0):
+        self.path = path
+        self.refresh_margin = refresh_margin
+        self.save_delay = save_delay
+        self.channel: Optional[discord.abc.Messageable] = None
+
+        self._urls: Dict[str, Tuple[str, Optional[float]]] = {}
+        self._uploading: Dict[str, asyncio.Task] = {}
+        self._dirty = False
+        self._save_task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._urls)
+
+    def load(self):
+        if self.channel is None or not self.path.exists():
+            return
+
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable image URL registry {self.path}: {e}")
+            return
+
+        # URLs from another channel, or from before there was one, may not last
+        if not isinstance(entries, dict) or entries.get("channel") != self.channel.id:
+            logger.info(f"Ignoring image URLs in {self.path}, they were not uploaded to channel {self.channel.id}")
+            return
+
+        self._urls = {name: (url, expires) for name, (url, expires) in entries["urls"].items()}
+        logger.info(f"Loaded {len(self._urls)} image URLs")
+
+    def _entries(self) -> dict:
+        self._dirty = False
+        return {
+            "channel": self.channel.id,
+            "urls": {name: [url, expires] for name, (url, expires) in self._urls.items()},
+        }
+
+    def _write(self, entries: dict):
+        temp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(temp_path, "w") as f:
+            json.dump(entries, f)
+        os.replace(temp_path, self.path)
+
+    def save(self):
+        if self._dirty:
+            self._write(self._entries())
+
+    def save_soon(self):
+        self._dirty = True
+
+        # Batch the writes of a burst of uploads into one
+        if self._save_task is None or self._save_task.done():
+            self._save_task = asyncio.create_task(self._save_later())
+
+    async def _save_later(self):
+        await asyncio.sleep(self.save_delay)
+        if self._dirty:
+            await asyncio.to_thread(self._write, self._entries())
+
+    def get(self, name: str) -> Optional[str]:
+        entry = self._urls.get(name)
+        if entry is None:
+            return None
+
+        url, expires = entry
+        if expires is not None and expires - self.refresh_margin < time.time():
+            del self._urls[name]
+            return None
+        return url
+
+    def needs_upload(self, name: str) -> bool:
+        return self.channel is not None and self.get(name) is None
+
+    def record(self, name: str, url: str):
+        self._urls[name] = (url, url_expiry(url))
+        self.save_soon()
+
+    async def url(self, name: str) -> Optional[str]:
+        """Returns a link to the image `name`, uploading it to the storage channel first if needed.
+
+        Returns None when there is no channel or the upload failed, the image has to be attached then.
+        """
+        if self.channel is None:
+            return None
+
+        url = self.get(name)
+        if url is not None:
+            return url
+
+        # Pages showing the same image at once share one upload
+        task = self._uploading.get(name)
+        if task is None:
+            task = self._uploading[name] = asyncio.create_task(self._upload(name))
+            task.add_done_callback(lambda _: self._uploading.pop(name, None))
+
+        # A caller giving up must not cancel the upload for everyone else
+        return await asyncio.shield(task)
+
+    async def _upload(self, name: str) -> Optional[str]:
+        try:
+            message = await self.channel.send(file=IMAGES.file(name))
+        except discord.HTTPException as e:
+            logger.warning(f"Failed uploading {name} to the image channel: {e}")
+            return None
+
+        url = message.attachments[0].url
+        self.record(name, url)
+        return url
+
+
+IMAGES = ImageStore(Path("PNG_Images"))
+IMAGE_URLS = ImageURLRegistry(Path("image_urls.json"))
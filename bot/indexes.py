@@ -0,0 +1,82 @@
+import re
+import sqlite3
+import time
+from typing import List, NamedTuple
+
+from loguru import logger
+
+
+class Index(NamedTuple):
+    table: str
+    columns: str
+    # A lookup that must seek this index rather than scan the table
+    probe: str
+
+    @property
+    def name(self) -> str:
+        columns = re.sub(r"\s+COLLATE\s+(\w+)", r"_\1", self.columns, flags=re.IGNORECASE)
+        columns = re.sub(r"\W+", "_", columns).lower()
+        return f"idx_{self.table}_{columns}"
+
+
+ITEM_INDEXES = [
+    Index("locale_en", "data COLLATE NOCASE", "SELECT * FROM locale_en WHERE data == ? COLLATE NOCASE"),
+    Index("items", "real_name COLLATE NOCASE", "SELECT * FROM items WHERE real_name == ? COLLATE NOCASE"),
+    Index("spells", "real_name COLLATE NOCASE", "SELECT * FROM spells WHERE real_name == ? COLLATE NOCASE"),
+    Index("spells", "real_name", "SELECT * FROM spells WHERE real_name == ?"),
+    Index("spells", "template_id", "SELECT * FROM spells WHERE template_id == ?"),
+    Index("spells", "description", "SELECT * FROM spells WHERE description == ?"),
+    Index("mobs", "real_name COLLATE NOCASE", "SELECT * FROM mobs WHERE real_name == ? COLLATE NOCASE"),
+    Index("pets", "real_name COLLATE NOCASE", "SELECT * FROM pets WHERE real_name == ? COLLATE NOCASE"),
+    Index("fish", "real_name COLLATE NOCASE", "SELECT * FROM fish WHERE real_name == ? COLLATE NOCASE"),
+    Index("item_stats", "item", "SELECT * FROM item_stats WHERE item == ?"),
+    Index("mob_stats", "mob", "SELECT * FROM mob_stats WHERE mob == ?"),
+    Index("mob_items", "mob", "SELECT * FROM mob_items WHERE mob == ?"),
+    Index("spell_effects", "spell_id, num_targets", "SELECT * FROM spell_effects WHERE spell_id == ? AND num_targets == ?"),
+    Index("effects", "spell", "SELECT * FROM effects WHERE spell == ?"),
+    Index("pet_cards", "pet", "SELECT * FROM pet_cards WHERE pet == ?"),
+    Index("talents", "pet", "SELECT * FROM talents WHERE pet == ?"),
+    Index("deck", "name", "SELECT * FROM deck WHERE name == ?"),
+    Index("statcaps", "level, school", "SELECT * FROM statcaps WHERE level = ? AND school = ?"),
+]
+
+DECK_INDEXES = [
+    Index("deck", "name", "SELECT * FROM deck WHERE name == ?"),
+]
+
+
+def _seeks_index(plan: List[tuple]) -> bool:
+    details = [row[-1] for row in plan]
+    return bool(details) and not any(detail.startswith("SCAN") for detail in details)
+
+
+async def build_indexes(db, indexes: List[Index], label: str) -> int:
+    """Creates every index of the manifest on `db` and checks its probe query.
+
+    Returns how many probes seek an index. Tables missing from the database are skipped.
+    """
+    started = time.perf_counter()
+    seeking = 0
+    built = 0
+
+    for index in indexes:
+        try:
+            await db.execute(f"CREATE INDEX IF NOT EXISTS {index.name} ON {index.table}({index.columns})")
+        except sqlite3.OperationalError as e:
+            logger.warning(f"Skipping index {index.name} on {label}: {e}")
+            continue
+
+        built += 1
+        async with db.execute(f"EXPLAIN QUERY PLAN {index.probe}", (None,) * index.probe.count("?")) as cursor:
+            plan = await cursor.fetchall()
+
+        if _seeks_index(plan):
+            seeking += 1
+        else:
+            logger.warning(f"{label}: '{index.probe}' does not use an index ({'; '.join(row[-1] for row in plan)})")
+
+    await db.commit()
+
+    elapsed = (time.perf_counter() - started) * 1000
+    logger.info(f"Built {built} indexes on {label} in {elapsed:.0f}ms, {seeking}/{len(indexes)} lookups seek an index")
+    return seeking
@@ -1,69 +1,154 @@
-from typing import List
-from pathlib import Path
+import asyncio
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Union
 
 import discord
 from discord import ui
+from loguru import logger
+
+from ..images import IMAGE_URLS, IMAGES
+
+Page = Tuple[discord.Embed, Optional[discord.File]]
+PageFactory = Callable[[int], Awaitable[Union[discord.Embed, Page]]]
 
 
 class ItemView(ui.View):
-    def __init__(self, entries: List[discord.Embed], *, files: List[discord.File] = [], timeout: float | None = 180.0):
+    """Pages through embeds, optionally each with an image attachment.
+
+    Pages come from a list of prebuilt embeds, or from `page_factory`, which
+    renders the page at a zero-based index on demand. Rendered pages are kept
+    in a small LRU and the page after the one being shown is rendered in the
+    background.
+    """
+
+    def __init__(
+        self,
+        entries: List[discord.Embed] = [],
+        *,
+        files: List[discord.File] = [],
+        page_factory: Optional[PageFactory] = None,
+        total_entries: Optional[int] = None,
+        cache_size: int = 8,
+        timeout: float | None = 180.0,
+    ):
         super().__init__(timeout=timeout)
 
-        self.entries = entries
-        if files:
-            self.files = list(files)
-        else:
-            self.files = []
+        if page_factory is None:
+            entries = list(entries)
+            files = list(files)
+
+            async def page_factory(index: int) -> Page:
+                return entries[index], files[index] if files else None
+
+            total_entries = len(entries)
+
+        self.page_factory = page_factory
+        self.total_entries = total_entries
+        self.cache_size = cache_size
         self.user = None
         self.current_page = 1
-        self.total_entries = len(self.entries)
+
+        self._pages: OrderedDict[int, Page] = OrderedDict()
+        self._rendering: Dict[int, asyncio.Task] = {}
 
     def format_entry(self, entry: discord.Embed) -> discord.Embed:
         return entry.set_footer(
             text=f"Showing page {self.current_page}/{self.total_entries}"
         )
 
-    def get_current_page(self) -> discord.Embed:
+    async def _render_page(self, page: int) -> Page:
+        try:
+            result = await self.page_factory(page - 1)
+            rendered = result if isinstance(result, tuple) else (result, None)
+            if rendered[1]:
+                # Upload the image now too, so showing the page never waits on it
+                await IMAGE_URLS.url(self.image_name(rendered[1]))
+        finally:
+            self._rendering.pop(page, None)
+
+        self._pages[page] = rendered
+        while len(self._pages) > self.cache_size:
+            self._pages.popitem(last=False)
+
+        return rendered
+
+    def _render(self, page: int) -> asyncio.Task:
+        # Requests for a page that is already rendering share its task
+        task = self._rendering.get(page)
+        if task is None:
+            task = self._rendering[page] = asyncio.create_task(self._render_page(page))
+            # Prefetches, and renders whose interaction gave up, have nobody awaiting them
+            task.add_done_callback(self._on_render_done)
+        return task
+
+    def prefetch(self, page: int):
+        if 1 <= page <= self.total_entries and page not in self._pages:
+            self._render(page)
+
+    def _on_render_done(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.opt(exception=task.exception()).warning("Failed rendering a page")
+
+    async def get_page(self, page: int) -> Page:
+        rendered = self._pages.get(page)
+        if rendered is not None:
+            self._pages.move_to_end(page)
+            return rendered
+
+        return await self._render(page)
+
+    async def get_current_page(self) -> Page:
         # Make sure our page is always in bounds.
         self.current_page = min(self.current_page, self.total_entries)
         self.current_page = max(self.current_page, 1)
 
+        embed, file = await self.get_page(self.current_page)
+
         # Return the formatted embed entry to display.
-        entry = self.entries[self.current_page - 1]
-        return self.format_entry(entry)
-    
-    def get_current_file(self) -> discord.Embed:
-        if not self.files:
+        return self.format_entry(embed), await self.attach_image(embed, file)
+
+    @staticmethod
+    def image_name(file: discord.File) -> str:
+        return file.filename.replace(" ", "")
+
+    async def attach_image(self, embed: discord.Embed, file: Optional[discord.File]) -> Optional[discord.File]:
+        """Links the page's image from the image channel, otherwise returns a file to attach."""
+        if not file:
             return None
-        
-        # Make sure our page is always in bounds.
-        self.current_page = min(self.current_page, self.total_entries)
-        self.current_page = max(self.current_page, 1)
 
-        # Return the formatted embed entry to display.
-        file = self.files[self.current_page - 1]
-        if file:
-            file_name = file.filename.replace(" ", "")
-            file_path = Path("PNG_Images") / file_name
-            self.files[self.current_page - 1] = discord.File(file_path, filename=file.filename)
-        else:
-            self.files[self.current_page - 1] = None
+        url = await IMAGE_URLS.url(self.image_name(file))
+        if url is not None:
+            embed.set_thumbnail(url=url)
+            return None
+
+        # Files are consumed once sent, so every attachment gets a fresh one
+        embed.set_thumbnail(url=f"attachment://{file.filename}")
+        return IMAGES.file(self.image_name(file), filename=file.filename)
 
-        return file
+    def is_ready(self, page: int) -> bool:
+        # Whether the page can be shown without rendering it or uploading its image
+        rendered = self._pages.get(page)
+        if rendered is None:
+            return False
+        return not rendered[1] or not IMAGE_URLS.needs_upload(self.image_name(rendered[1]))
 
     async def update(self, interaction: discord.Interaction):
-        if self.files:
-            file_list = []
-            if self.get_current_file():
-                file_list.append(self.get_current_file())
-
-            await interaction.response.edit_message(
-                embed=self.get_current_page(), view=self, attachments=file_list
-            )
+        # Rendering a page or uploading its image can outlast the interaction's 3 second deadline
+        if not self.is_ready(min(max(self.current_page, 1), self.total_entries)):
+            await interaction.response.defer()
+
+        embed, file = await self.get_current_page()
+        attachments = [file] if file else []
+        if interaction.response.is_done():
+            await interaction.edit_original_response(embed=embed, view=self, attachments=attachments)
         else:
-            await interaction.response.edit_message(
-                embed=self.get_current_page(), view=self
-            )
+            await interaction.response.edit_message(embed=embed, view=self, attachments=attachments)
+
+        self.prefetch(self.current_page + 1)
+
+    async def on_timeout(self):
+        for task in list(self._rendering.values()):
+            task.cancel()
 
     @ui.button(style=discord.ButtonStyle.primary, emoji="⏪")
     async def goto_first_button(
@@ -100,17 +185,22 @@ class ItemView(ui.View):
 
         # When we only have one embed to show, we don't need to paginate.
         if self.total_entries == 1:
-            if self.get_current_file():
-                await interaction.followup.send(embed=self.entries[0], file=self.files[0])
+            embed, file = await self.get_page(1)
+            file = await self.attach_image(embed, file)
+            if file:
+                await interaction.followup.send(embed=embed, file=file)
 
             else:
-                await interaction.followup.send(embed=self.entries[0])
+                await interaction.followup.send(embed=embed)
 
         else:
-            if self.get_current_file():
-                await interaction.followup.send(embed=self.get_current_page(), view=self, file=self.get_current_file())
-                await self.wait()
+            embed, file = await self.get_current_page()
+            if file:
+                await interaction.followup.send(embed=embed, view=self, file=file)
 
             else:
-                await interaction.followup.send(embed=self.get_current_page(), view=self)
-                await self.wait()
+                await interaction.followup.send(embed=embed, view=self)
+
+            # Render the next page while the user reads this one
+            self.prefetch(self.current_page + 1)
+            await self.wait()
@@ -0,0 +1,196 @@
+import itertools
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Set
+
+import aiosqlite
+from loguru import logger
+
+_PATCH_IDS = itertools.count()
+
+# Which derived structures have to be rebuilt when a table changes
+DERIVED_FROM = {
+    "locale_en": {"item", "spell", "mob", "pet", "fish", "spell_descriptions"},
+    "items": {"item"},
+    "spells": {"spell", "spell_descriptions"},
+    "mobs": {"mob"},
+    "pets": {"pet"},
+    "fish": {"fish"},
+    "mob_stats": {"mob_stats"},
+    "mob_items": {"mob_stats"},
+    "item_stats": {"mob_stats"},
+}
+
+
+@dataclass
+class TableDiff:
+    table: str
+    inserted: int
+    updated: int
+    deleted: int
+
+    @property
+    def changed(self) -> int:
+        return self.inserted + self.updated + self.deleted
+
+
+@dataclass
+class PatchReport:
+    tables: List[TableDiff] = field(default_factory=list)
+    # Tables whose schema differs; only a full reload picks those up
+    skipped: List[str] = field(default_factory=list)
+    derived: Set[str] = field(default_factory=set)
+    elapsed: float = 0.0
+    # Set when the bot had to reload everything instead
+    reloaded: bool = False
+
+    @property
+    def changed(self) -> int:
+        return sum(diff.changed for diff in self.tables)
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+async def _tables(db, schema: str) -> Set[str]:
+    async with db.execute(f"SELECT name FROM {schema}.sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'") as cursor:
+        return {row[0] for row in await cursor.fetchall()}
+
+
+async def _table_info(db, schema: str, table: str) -> List[tuple]:
+    async with db.execute(f"PRAGMA {schema}.table_info({_quote(table)})") as cursor:
+        return await cursor.fetchall()
+
+
+async def _count(db, sql: str) -> int:
+    async with db.execute(sql) as cursor:
+        return (await cursor.fetchone())[0]
+
+
+class _TablePatch:
+    def __init__(self, table: str, columns: List[tuple]):
+        self.name = table
+        self.table = _quote(table)
+        self.columns = ", ".join(_quote(column[1]) for column in columns)
+
+        # Rows are matched on the primary key, or on the rowid if there is none
+        primary_key = [_quote(column[1]) for column in sorted(columns, key=lambda column: column[5]) if column[5]]
+        self.key = primary_key or ["rowid"]
+        self.key_aliases = ", ".join(f"_k{n}" for n in range(len(self.key)))
+        self.key_columns = ", ".join(f"{key} AS _k{n}" for n, key in enumerate(self.key))
+        self.key_tuple = "(" + ", ".join(self.key) + ")"
+
+        # Keep rowids stable when they are the only key
+        self.copied = self.columns if primary_key else f"rowid, {self.columns}"
+
+        self.changed = _quote(f"_patch_changed_{table}")
+        self.deleted = _quote(f"_patch_deleted_{table}")
+
+    async def diff(self, db) -> TableDiff:
+        # A row is new or updated when its full contents are not in the live copy
+        await db.execute(
+            f"CREATE TEMP TABLE {self.changed} AS SELECT {self.key_aliases} FROM ("
+            f"SELECT {self.key_columns}, {self.columns} FROM patch.{self.table} "
+            f"EXCEPT SELECT {self.key_columns}, {self.columns} FROM main.{self.table})"
+        )
+        await db.execute(
+            f"CREATE TEMP TABLE {self.deleted} AS "
+            f"SELECT {self.key_columns} FROM main.{self.table} "
+            f"EXCEPT SELECT {self.key_columns} FROM patch.{self.table}"
+        )
+
+        changed = await _count(db, f"SELECT count(*) FROM temp.{self.changed}")
+        updated = await _count(
+            db,
+            f"SELECT count(*) FROM temp.{self.changed} WHERE ({self.key_aliases}) IN (SELECT {', '.join(self.key)} FROM main.{self.table})",
+        )
+        deleted = await _count(db, f"SELECT count(*) FROM temp.{self.deleted}")
+        return TableDiff(self.name, changed - updated, updated, deleted)
+
+    async def apply(self, db):
+        await db.execute(
+            f"DELETE FROM main.{self.table} WHERE {self.key_tuple} IN ("
+            f"SELECT {self.key_aliases} FROM temp.{self.changed} UNION ALL SELECT {self.key_aliases} FROM temp.{self.deleted})"
+        )
+        await db.execute(
+            f"INSERT INTO main.{self.table} ({self.copied}) SELECT {self.copied} FROM patch.{self.table} "
+            f"WHERE {self.key_tuple} IN (SELECT {self.key_aliases} FROM temp.{self.changed})"
+        )
+
+    async def drop(self, db):
+        await db.execute(f"DROP TABLE IF EXISTS temp.{self.changed}")
+        await db.execute(f"DROP TABLE IF EXISTS temp.{self.deleted}")
+
+
+async def patch_database(db, source: Path) -> PatchReport:
+    """Brings the database behind `db` up to date with `source`, changing only the rows that differ.
+
+    `db` must be a writable connection. Reads from other connections only wait for
+    the final write transaction, not for the diff.
+    """
+    started = time.perf_counter()
+    report = PatchReport()
+
+    # Attached files would resolve through the live copy's memdb VFS, so stage one there
+    uri = f"file:/patch-{next(_PATCH_IDS)}?vfs=memdb"
+    staging = await aiosqlite.connect(uri, uri=True)
+    async with aiosqlite.connect(source) as source_db:
+        await source_db.backup(staging)
+
+    await db.execute("ATTACH DATABASE ? AS patch", (uri,))
+    patches = []
+    try:
+        live_tables = await _tables(db, "main")
+        patch_tables = await _tables(db, "patch")
+        report.skipped.extend(sorted(live_tables ^ patch_tables))
+
+        # Diff every table before taking the write lock
+        for table in sorted(live_tables & patch_tables):
+            columns = await _table_info(db, "main", table)
+            if columns != await _table_info(db, "patch", table):
+                report.skipped.append(table)
+                continue
+
+            patch = _TablePatch(table, columns)
+            patches.append(patch)
+            diff = await patch.diff(db)
+            if diff.changed:
+                report.tables.append(diff)
+                report.derived |= DERIVED_FROM.get(table, set())
+
+        changed_tables = {diff.table for diff in report.tables}
+        if changed_tables:
+            await db.execute("BEGIN IMMEDIATE")
+            for patch in patches:
+                if patch.name in changed_tables:
+                    await patch.apply(db)
+            await db.commit()
+    finally:
+        # A failed apply or commit leaves the transaction open, and nothing detaches inside one
+        if db.in_transaction:
+            try:
+                await db.rollback()
+            except sqlite3.Error as e:
+                logger.warning(f"Failed rolling back the patch from {source}: {e}")
+
+        # Cleanup errors are logged so they never hide the error that got us here
+        try:
+            for patch in patches:
+                await patch.drop(db)
+        except sqlite3.Error as e:
+            logger.warning(f"Failed dropping the patch diff tables: {e}")
+        try:
+            await db.execute("DETACH DATABASE patch")
+        except sqlite3.Error as e:
+            logger.warning(f"Failed detaching the patch database: {e}")
+        await staging.close()
+
+    report.elapsed = time.perf_counter() - started
+    logger.info(
+        f"Patched {report.changed} rows across {len(report.tables)} tables from {source} in {report.elapsed * 1000:.0f}ms"
+        + (f", skipped {', '.join(report.skipped)}" if report.skipped else "")
+    )
+    return report
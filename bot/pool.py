@@ -0,0 +1,105 @@
+import asyncio
+import itertools
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import List
+
+import aiosqlite
+from loguru import logger
+
+_POOL_IDS = itertools.count()
+
+
+class ConnectionPool:
+    """Read-only aiosqlite connections sharing one in-memory copy of a database.
+
+    The copy lives in SQLite's `memdb` VFS, so every connection sees the same
+    image but has its own worker thread and page cache. `execute` is used
+    exactly like `aiosqlite.Connection.execute`.
+    """
+
+    def __init__(self, uri: str, writer: aiosqlite.Connection, connections: List[aiosqlite.Connection], slow_checkout: float = 0.05):
+        self.uri = uri
+        self.writer = writer
+        self.size = len(connections)
+        self.closed = False
+        self.slow_checkout = slow_checkout
+
+        self.checkouts = 0
+        self.waits = 0
+        self.slow_checkouts = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+        self._connections = connections
+        self._idle: asyncio.Queue[aiosqlite.Connection] = asyncio.Queue()
+        for connection in connections:
+            self._idle.put_nowait(connection)
+
+    @classmethod
+    async def open(cls, source: Path, name: str, size: int = 4, cached_statements: int = 64) -> "ConnectionPool":
+        uri = f"file:/{name}-{next(_POOL_IDS)}?vfs=memdb"
+
+        # The writer keeps the image alive and is the only connection allowed to change it
+        writer = await aiosqlite.connect(uri, uri=True)
+        async with aiosqlite.connect(source) as db:
+            await db.backup(writer)
+
+        connections = []
+        for _ in range(size):
+            connection = await aiosqlite.connect(uri, uri=True, cached_statements=cached_statements)
+            await connection.execute("PRAGMA query_only = ON")
+            connections.append(connection)
+
+        return cls(uri, writer, connections)
+
+    @asynccontextmanager
+    async def connection(self):
+        if self.closed:
+            raise ValueError(f"Connection pool for {self.uri} is closed")
+
+        started = time.perf_counter()
+        if self._idle.empty():
+            self.waits += 1
+
+        connection = await self._idle.get()
+
+        waited = time.perf_counter() - started
+        self.checkouts += 1
+        self.wait_time += waited
+        self.max_wait = max(self.max_wait, waited)
+        if waited > self.slow_checkout:
+            self.slow_checkouts += 1
+            logger.debug(f"Waited {waited * 1000:.1f}ms for a connection to {self.uri}")
+
+        try:
+            yield connection
+        finally:
+            self._idle.put_nowait(connection)
+
+    @asynccontextmanager
+    async def execute(self, sql: str, parameters=None):
+        async with self.connection() as connection:
+            async with connection.execute(sql, parameters) as cursor:
+                yield cursor
+
+    async def close(self):
+        self.closed = True
+
+        # Wait for every checked out connection to come back first
+        for _ in range(self.size):
+            connection = await self._idle.get()
+            await connection.close()
+        await self.writer.close()
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "idle": self._idle.qsize(),
+            "checkouts": self.checkouts,
+            "waits": self.waits,
+            "slow_checkouts": self.slow_checkouts,
+            "mean_wait": self.wait_time / self.checkouts if self.checkouts else 0.0,
+            "max_wait": self.max_wait,
+        }
@@ -0,0 +1,222 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, defaultdict
+from heapq import nlargest
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set
+
+
+def _trigrams(text: str) -> Set[str]:
+    # Pad so short names and word starts still produce grams.
+    padded = f"  {text.lower()} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+NO_STRING = 0xFFFFFFFF
+
+
+class StringHeap:
+    """Distinct strings packed into UTF-8 buffers and referenced by 32-bit ids.
+
+    Ids follow case-folded order, so the strings sharing a prefix have consecutive ids.
+    """
+
+    def __init__(self, strings: Iterable[str]):
+        distinct = sorted({string for string in strings if string}, key=lambda string: (string.lower(), string))
+
+        self._data, self._offsets = self._pack(string.encode() for string in distinct)
+        self._folded, self._folded_offsets = self._pack(string.lower().encode() for string in distinct)
+
+        # Strings equal but for case have consecutive ids, each maps to the first of them
+        self._fold_groups = array("I")
+        for string_id in range(len(distinct)):
+            if string_id and self.folded(string_id) == self.folded(string_id - 1):
+                self._fold_groups.append(self._fold_groups[-1])
+            else:
+                self._fold_groups.append(string_id)
+
+    @staticmethod
+    def _pack(encoded: Iterable[bytes]):
+        parts = list(encoded)
+        offsets = array("I", [0])
+        for part in parts:
+            offsets.append(offsets[-1] + len(part))
+        return b"".join(parts), offsets
+
+    @classmethod
+    def build(cls, strings: Sequence[Optional[str]]):
+        """Returns the heap of `strings` and the id of every one of them, `NO_STRING` for empty ones."""
+        heap = cls(strings)
+        ids = {heap[string_id]: string_id for string_id in range(len(heap))}
+        return heap, array("I", (ids.get(string, NO_STRING) if string else NO_STRING for string in strings))
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, string_id: int) -> str:
+        return self._data[self._offsets[string_id]:self._offsets[string_id + 1]].decode()
+
+    def folded(self, string_id: int) -> bytes:
+        return self._folded[self._folded_offsets[string_id]:self._folded_offsets[string_id + 1]]
+
+    def fold_group(self, string_id: int) -> int:
+        return self._fold_groups[string_id]
+
+    def containing(self, text: str) -> Iterator[int]:
+        """Yields the ids of every string containing `text`, ignoring case, in order."""
+        needle = text.lower().encode()
+        if not needle:
+            yield from range(len(self))
+            return
+
+        # Search the whole folded buffer at once and map every hit back to its string
+        position = self._folded.find(needle)
+        while position != -1:
+            string_id = bisect_right(self._folded_offsets, position) - 1
+            end = self._folded_offsets[string_id + 1]
+            if position + len(needle) <= end:
+                yield string_id
+                position = self._folded.find(needle, end)
+            else:
+                position = self._folded.find(needle, position + 1)
+
+    def prefixed(self, prefix: str) -> range:
+        """Returns the ids of every string starting with `prefix`, ignoring case."""
+        prefix = prefix.lower().encode()
+        ids = range(len(self))
+        start = bisect_left(ids, prefix, key=self.folded)
+        # No folded string sorts past the prefix followed by the highest UTF-8 lead byte
+        stop = bisect_left(ids, prefix + b"\xff", lo=start, key=self.folded)
+        return range(start, stop)
+
+
+class NameIndex:
+    """Trigram inverted index over the distinct names of one table.
+
+    Names live in a `StringHeap` and are only decoded for results, `allowed`
+    callbacks receive string ids.
+    """
+
+    def __init__(self, strings: StringHeap):
+        self.strings = strings
+        self._sizes = array("H")
+
+        postings: Dict[str, array] = defaultdict(lambda: array("I"))
+        for name_id in range(len(strings)):
+            grams = _trigrams(strings[name_id])
+            self._sizes.append(len(grams))
+            for gram in grams:
+                postings[gram].append(name_id)
+
+        self._postings = dict(postings)
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+    def closest(self, query: str, limit: int = 50, allowed: Optional[Callable[[int], bool]] = None) -> List[str]:
+        """Returns up to `limit` names sharing the most trigrams with `query`, best first."""
+        grams = _trigrams(query)
+
+        hits = Counter()
+        for gram in grams:
+            name_ids = self._postings.get(gram)
+            if name_ids:
+                hits.update(name_ids)
+
+        # Jaccard similarity of the trigram sets.
+        scored = (
+            (shared / (len(grams) + self._sizes[name_id] - shared), name_id)
+            for name_id, shared in hits.items()
+            if allowed is None or allowed(name_id)
+        )
+        return [self.strings[name_id] for _, name_id in nlargest(limit, scored)]
+
+    def complete(self, prefix: str, limit: int = 25, allowed: Optional[Callable[[int], bool]] = None, max_scan: int = 2000) -> List[str]:
+        """Returns up to `limit` names starting with `prefix`, ignoring case."""
+        name_ids = self.strings.prefixed(prefix)
+
+        results = []
+        for name_id in name_ids[:max_scan]:
+            if allowed is None or allowed(name_id):
+                results.append(self.strings[name_id])
+                if len(results) >= limit:
+                    break
+
+        return results
+
+    def containing(self, text: str, allowed: Optional[Callable[[int], bool]] = None) -> List[str]:
+        """Returns every name containing `text`, ignoring case, in sorted order."""
+        return [
+            self.strings[name_id]
+            for name_id in self.strings.containing(text)
+            if allowed is None or allowed(name_id)
+        ]
+
+
+class FilterMask:
+    """The set of rows of a `FilterIndex` that passed a filter."""
+
+    def __init__(self, index: "FilterIndex", bits: Optional[bytes]):
+        self._index = index
+        self._bits = bits
+
+    def _has_row(self, row: int) -> bool:
+        return self._bits is None or bool(self._bits[row >> 3] & (1 << (row & 7)))
+
+    def __contains__(self, name_id: int) -> bool:
+        return any(self._has_row(row) for row in self._index.rows_of(name_id))
+
+
+class FilterIndex:
+    """Bitsets of row positions for every value of every filterable column.
+
+    `rows` are `(name, *values)` tuples in the order of `columns`, and
+    `name_ids` holds the id of every row's name in `strings`. Filtering intersects
+    the bitsets of the requested values in memory, so SQL is only needed to
+    fetch the rows that survive.
+    """
+
+    def __init__(self, columns: Sequence[str], rows: Iterable[tuple], strings: StringHeap, name_ids: Sequence[int]):
+        self.columns = tuple(columns)
+        self.strings = strings
+
+        rows = list(rows)
+        self.row_count = len(rows)
+        size = (self.row_count + 7) >> 3
+
+        # Rows sorted by name ignoring case, so the rows of one name are a bisectable run
+        groups = [NO_STRING if name_id == NO_STRING else strings.fold_group(name_id) for name_id in name_ids]
+        self._rows_by_name = array("I", sorted(range(self.row_count), key=groups.__getitem__))
+        self._sorted_name_ids = array("I", (groups[row] for row in self._rows_by_name))
+
+        values: List[Dict[Any, bytearray]] = [{} for _ in self.columns]
+        for row_id, (name, *attributes) in enumerate(rows):
+            for column, value in zip(values, attributes):
+                bits = column.get(value)
+                if bits is None:
+                    bits = column[value] = bytearray(size)
+                bits[row_id >> 3] |= 1 << (row_id & 7)
+
+        self._bitsets = [
+            {value: int.from_bytes(bits, "little") for value, bits in column.items()}
+            for column in values
+        ]
+
+    def rows_of(self, name_id: int) -> array:
+        group = self.strings.fold_group(name_id)
+        start = bisect_left(self._sorted_name_ids, group)
+        stop = bisect_left(self._sorted_name_ids, group + 1, lo=start)
+        return self._rows_by_name[start:stop]
+
+    def select(self, **filters) -> FilterMask:
+        """Intersects the bitsets of all filters whose value is not None."""
+        mask = None
+        for column, value in filters.items():
+            if value is None:
+                continue
+
+            bits = self._bitsets[self.columns.index(column)].get(value, 0)
+            mask = bits if mask is None else mask & bits
+
+        if mask is None:
+            return FilterMask(self, None)
+        return FilterMask(self, mask.to_bytes((self.row_count + 7) >> 3, "little"))
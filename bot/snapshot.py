@@ -0,0 +1,51 @@
+import hashlib
+import mmap
+import os
+import pickle
+from pathlib import Path
+from typing import Optional
+
+from loguru import logger
+
+# Bump whenever the layout of the snapshotted structures changes
+SNAPSHOT_FORMAT = 2
+
+_MAGIC = b"WIZSNAP"
+
+
+def content_hash(*paths: Path) -> str:
+    """Hashes the contents of the given database files."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{SNAPSHOT_FORMAT};".encode())
+    for path in paths:
+        with open(path, "rb") as f:
+            digest.update(hashlib.file_digest(f, "blake2b").digest())
+    return digest.hexdigest()
+
+
+def load_snapshot(path: Path, key: str) -> Optional[dict]:
+    """Returns the snapshotted state if `path` was written for `key`."""
+    if not path.exists():
+        return None
+
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            header_end = data.find(b"\n")
+            if data[:header_end] != _MAGIC + b" " + key.encode():
+                return None
+
+            with memoryview(data) as view:
+                return pickle.loads(view[header_end + 1:])
+    except (OSError, ValueError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+        logger.warning(f"Ignoring unreadable snapshot {path}: {e}")
+        return None
+
+
+def save_snapshot(path: Path, key: str, state: dict):
+    temp_path = path.with_name(path.name + ".tmp")
+    with open(temp_path, "wb") as f:
+        f.write(_MAGIC + b" " + key.encode() + b"\n")
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    # Readers only ever see a complete snapshot
+    os.replace(temp_path, path)
@@ -0,0 +1,127 @@
+import mmap
+import struct
+import zlib
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple
+
+MAGIC = b"KIWAD"
+
+_HEADER = struct.Struct("<5sII")
+_FLAGS = struct.Struct("<B")
+# offset, size, zipped size, is zipped, crc, name length
+_ENTRY = struct.Struct("<IIIBII")
+
+
+class WadEntry(NamedTuple):
+    name: str
+    offset: int
+    size: int
+    zipped_size: int
+    is_zip: bool
+    crc: int
+
+
+class Wad:
+    """Read-only view of a KIWAD archive such as `Root.wad`.
+
+    The archive is memory-mapped, so only the entries that are read are paged
+    in, and each is decompressed on its own.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as e:
+            self._file.close()
+            raise ValueError(f"{self.path} is empty") from e
+
+        try:
+            self.entries = self._read_entries()
+        except struct.error as e:
+            self.close()
+            raise ValueError(f"{self.path} is truncated") from e
+        except Exception:
+            self.close()
+            raise
+
+    def _read_entries(self) -> Dict[str, WadEntry]:
+        magic, self.version, count = _HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a KIWAD archive")
+
+        position = _HEADER.size
+        self.flags = 0
+        if self.version >= 2:
+            (self.flags,) = _FLAGS.unpack_from(self._map, position)
+            position += _FLAGS.size
+
+        entries = {}
+        for _ in range(count):
+            offset, size, zipped_size, is_zip, crc, name_length = _ENTRY.unpack_from(self._map, position)
+            position += _ENTRY.size
+
+            name = self._map[position:position + name_length].rstrip(b"\0").decode("utf-8")
+            position += name_length
+
+            entries[name] = WadEntry(name, offset, size, zipped_size, bool(is_zip), crc)
+
+        return entries
+
+    def __enter__(self) -> "Wad":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.entries
+
+    def __iter__(self) -> Iterator[WadEntry]:
+        return iter(self.entries.values())
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def glob(self, *patterns: str) -> List[WadEntry]:
+        """Returns the entries whose path matches any of `patterns`, ignoring case."""
+        patterns = [pattern.replace("\\", "/").lower() for pattern in patterns]
+        return [
+            entry for entry in self.entries.values()
+            if any(fnmatchcase(entry.name.replace("\\", "/").lower(), pattern) for pattern in patterns)
+        ]
+
+    def read(self, entry: WadEntry | str) -> bytes:
+        if isinstance(entry, str):
+            entry = self.entries[entry]
+
+        if not entry.is_zip:
+            return self._map[entry.offset:entry.offset + entry.size]
+
+        data = zlib.decompress(self._map[entry.offset:entry.offset + entry.zipped_size], bufsize=entry.size)
+        if len(data) != entry.size:
+            raise ValueError(f"{entry.name} decompressed to {len(data)} bytes, expected {entry.size}")
+        return data
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+# Archives opened by this process, worker processes each map their own
+_OPEN_WADS: Dict[Path, Wad] = {}
+
+
+class WadSource(NamedTuple):
+    """A picklable reference to one entry, read wherever `read_bytes` is called."""
+
+    path: Path
+    entry: WadEntry
+
+    def read_bytes(self) -> bytes:
+        wad = _OPEN_WADS.get(self.path)
+        if wad is None:
+            wad = _OPEN_WADS[self.path] = Wad(self.path)
+        return wad.read(self.entry)